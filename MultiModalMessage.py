@@ -1,25 +1,46 @@
-import pandas as pd
-import os
-import re
+import io
+import sys
+import time
 from dotenv import load_dotenv
 from pathlib import Path
-from typing import AsyncGenerator, Sequence
-from PIL import Image
+from typing import AsyncGenerator, List, Sequence, Tuple
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
-from autogen_agentchat.agents import BaseChatAgent, UserProxyAgent, AssistantAgent
+from autogen_agentchat.agents import BaseChatAgent, AssistantAgent
 from autogen_agentchat.base import Response
 from autogen_agentchat.messages import ChatMessage, MultiModalMessage
 from autogen_core import CancellationToken, Image as AGImage
-from autogen_core.code_executor import CodeBlock
+from autogen_core.code_executor import CodeBlock, CodeResult
 from autogen_ext.code_executors.local import LocalCommandLineCodeExecutor
-from autogen_ext.models.openai import OpenAIChatCompletionClient
-from autogen_core.model_context import UnboundedChatCompletionContext
-from autogen_core.models import SystemMessage, UserMessage
-from autogen_agentchat.ui import Console
+from autogen_core.models import AssistantMessage, ChatCompletionClient, RequestUsage, SystemMessage, UserMessage
 from autogen_agentchat.teams import SelectorGroupChat
 from autogen_agentchat.conditions import TextMentionTermination
 
+# Shared helpers live next to the Streamlit app.
+sys.path.append(str(Path(__file__).resolve().parent / "StreamLitChatBot"))
+from response_cache import CacheLookup, ResponseCache, get_response_cache
+from code_repair import AttemptRecord, RepairPolicy, RepairSession, extract_code, fence_code
+from token_budget_context import TokenBudgetedChatCompletionContext
+from speaker_selection import planner_coder_selector
+from artifact_cache import thumbnail_bytes
+from workspace import WorkspaceManager, get_workspace_manager
+from manifest import changed_files, snapshot
+from output_capture import OUTPUT_FILENAME, spool_text
+from telemetry import span
+from traced_client import TracedChatCompletionClient, usage_attributes
+from execution_scheduler import EX_TEMPFAIL, ExecutionRejected, get_execution_scheduler
+from model_pool import get_model_client
+
+MODEL_IMAGE_SIZE = (1024, 1024)
+_IMAGE_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="image-decode")
+
+def _load_model_image(file: Path) -> AGImage:
+    from PIL import Image
+
+    # Downscaled copy: the model does not need full-resolution pixels
+    return AGImage(Image.open(io.BytesIO(thumbnail_bytes(str(file), MODEL_IMAGE_SIZE))))
+
 load_dotenv()
 
 class CloudServeAgent(BaseChatAgent):
@@ -27,88 +48,115 @@ class CloudServeAgent(BaseChatAgent):
         self,
         name: str,
         description: str = "An agent that generates a DataFrame and a matplotlib plot based on user inputs.",
-        work_dir: Path = Path("cloudserve")
+        work_dir: Path = Path("cloudserve"),
+        response_cache: ResponseCache | None = None,
+        repair_policy: RepairPolicy | None = None,
+        context_token_limit: int = 4000,
+        session_id: str = "default",
+        workspace: WorkspaceManager | None = None,
+        model_client: ChatCompletionClient | None = None,
     ):
         super().__init__(name=name, description=description)
         self.work_dir = work_dir
-        self.work_dir.mkdir(exist_ok=True)
-        self._model_context = UnboundedChatCompletionContext()
-        self.local_executor = LocalCommandLineCodeExecutor(work_dir=self.work_dir)
-        self._model_client = OpenAIChatCompletionClient(model="gpt-4o-mini")
+        self._workspace = workspace if workspace is not None else get_workspace_manager(work_dir)
+        self._session_id = session_id
+        self._model_client = model_client if model_client is not None else get_model_client()
+        self._model_context = TokenBudgetedChatCompletionContext(self._model_client, token_limit=context_token_limit)
+        self._response_cache = response_cache if response_cache is not None else get_response_cache()
+        self._repair_policy = repair_policy if repair_policy is not None else RepairPolicy()
+        self.attempts: List[AttemptRecord] = []
         self._system_message = [SystemMessage(content="""Write Only Python code what user asks for dont write anything else than code, Save outputs in current working directory, Always use png images to save images""")]
 
+    async def _generate(self, conversation_history, lookup: CacheLookup | None, cancellation_token: CancellationToken) -> Tuple[str, RequestUsage | None]:
+        """
+        Returns the model's answer for `conversation_history` and its token usage.
+        A cache hit in `lookup` is returned instead and has no usage.
+        """
+        with span("code_generation", messages=len(conversation_history)) as current:
+            cached = lookup.content if lookup is not None else None
+            current.set_attribute("cached", cached is not None)
+            if cached is not None:
+                return cached, None
+            response = await self._model_client.create(conversation_history, cancellation_token=cancellation_token)
+            for key, value in usage_attributes(response.usage).items():
+                current.set_attribute(key, value)
+        return response.content, response.usage
+
     @property
     def produced_message_types(self) -> Sequence[type[ChatMessage]]:
         return (MultiModalMessage,)
 
     async def on_messages(self, messages: Sequence[ChatMessage], cancellation_token: CancellationToken) -> Response:
+        with self._workspace.request_dir(self._session_id) as request_dir, span("coder_request", session=self._session_id) as current:
+            response = await self._handle_request(messages, request_dir, cancellation_token)
+            current.set_attribute("attempts", len(self.attempts))
+            current.set_attribute("retries", max(len(self.attempts) - 1, 0))
+            return response
+
+    async def _handle_request(self, messages: Sequence[ChatMessage], request_dir: Path, cancellation_token: CancellationToken) -> Response:
         content = []
         
-        for file in self.work_dir.iterdir():
-            if file.is_file():
-                os.remove(file)
-        
         for msg in messages:
             await self._model_context.add_message(UserMessage(content=msg.content, source=msg.source))
 
-        history = [
-            (msg.source if hasattr(msg, "source") else "system")
-            + ": "
-            + (msg.content if isinstance(msg.content, str) else "")
-            + "\n"
-            for msg in await self._model_context.get_messages()
-        ]
-        
-        print('this is History', history)
-        
-        error_details = None
-        conversation_history = self._system_message[:]
-        
-        if messages:
-            print(messages)
-            conversation_history.append(UserMessage(content=messages[0].content, source="user"))
-        response = await self._model_client.create(conversation_history, cancellation_token=cancellation_token)
-        initial_response_content = response.content
-        
-        pattern = re.compile(r"```(\w+)\n(.*?)```", re.DOTALL)
-        match = pattern.search(initial_response_content)
-        if match:
-            language = match.group(1)
-            code = match.group(2)
-        else:
-            language = "python"
-            code = initial_response_content
+        # Earlier requests of the session come back as a running summary once they exceed the token budget
+        conversation_history = self._system_message + await self._model_context.get_messages()
+        before = await asyncio.to_thread(snapshot, request_dir)
+        repair = RepairSession(self._repair_policy)
+        lookup = await self._response_cache.lookup(conversation_history)  # Keyed by the original prompt only
+        generation_started = time.monotonic()
+        response_content, usage = await self._generate(conversation_history, lookup, cancellation_token)
+        generation_seconds = time.monotonic() - generation_started
 
         while True:
-            try:
-                code_block = CodeBlock(language=language, code=code)
-                result = await self.local_executor.execute_code_blocks(
-                    code_blocks=[code_block],
-                    cancellation_token=cancellation_token,
-                )
-                df_output = result.stdout if hasattr(result, 'stdout') else str(result)
-                print(code_block.code)
+            language, code = extract_code(response_content)
+            if repair.is_repeat(code):
+                break  # The model returned code that already failed; running it again cannot help
+
+            execution_started = time.monotonic()
+            with span("execution", language=language, attempt=len(repair.attempts) + 1) as current:
+                try:
+                    code_block = CodeBlock(language=language, code=code)
+                    async with get_execution_scheduler().enqueue(self._session_id):
+                        result = await LocalCommandLineCodeExecutor(work_dir=request_dir).execute_code_blocks(
+                            code_blocks=[code_block],
+                            cancellation_token=cancellation_token,
+                        )
+                except ExecutionRejected as e:
+                    result = CodeResult(exit_code=EX_TEMPFAIL, output=f"Execution rejected because the server is busy ({e}). Please try again shortly.")
+                except Exception as e:
+                    result = CodeResult(exit_code=1, output=str(e))
+                current.set_attribute("exit_code", result.exit_code)
+            repair.record(code, result.exit_code, generation_seconds, time.monotonic() - execution_started, usage)
+            # The full output stays in the request directory; the message carries only its head and tail
+            df_output = (await asyncio.to_thread(spool_text, result.output, request_dir / OUTPUT_FILENAME)).preview()
+            if result.exit_code in (0, EX_TEMPFAIL) or not repair.can_retry():
                 break
-            except Exception as e:
-                error_details = str(e)
-                conversation_history.append(UserMessage(content=f"Error: {error_details}", source="user"))
-                fix_response = await self._model_client.create(conversation_history, cancellation_token=cancellation_token)
-                fixed_response_content = fix_response.content
-                match = pattern.search(fixed_response_content)
-                if match:
-                    language = match.group(1)
-                    code = match.group(2)
-                else:
-                    language = "python"
-                    code = fixed_response_content
-
-        print("Final Output:", df_output)
+
+            conversation_history.append(AssistantMessage(content=response_content, source=self.name))
+            conversation_history.append(UserMessage(content=repair.feedback(result.exit_code, result.output), source="user"))
+            generation_started = time.monotonic()
+            response_content, usage = await self._generate(conversation_history, None, cancellation_token)
+            generation_seconds = time.monotonic() - generation_started
+
+        self.attempts = repair.attempts
+        if result.exit_code == 0:
+            # Only code that ran successfully is cached, under the original prompt
+            verified = fence_code(language, code)
+            if verified != lookup.content:
+                await self._response_cache.store(lookup, verified)
+        elif lookup.content is not None and result.exit_code != EX_TEMPFAIL and not cancellation_token.is_cancelled():
+            await self._response_cache.discard(lookup)
         content.append(df_output)
         
-        for file in self.work_dir.iterdir():
-            if file.is_file() and file.suffix.lower() in ['.png', '.jpg', '.jpeg']:
-                GenImage = Image.open(file)
-                content.append(AGImage(GenImage))
+        with span("artifact_scan") as current:
+            produced = changed_files(before, await asyncio.to_thread(snapshot, request_dir))
+            image_files = [request_dir / name for name in produced if Path(name).suffix.lower() in ['.png', '.jpg', '.jpeg']]
+            current.set_attribute("files", len(produced))
+        # Decoding runs on a thread pool so it does not block the event loop shared with other sessions
+        loop = asyncio.get_running_loop()
+        images = await asyncio.gather(*(loop.run_in_executor(_IMAGE_POOL, _load_model_image, file) for file in image_files))
+        content.extend(images)
             
         multimodal_msg = MultiModalMessage(content=content, source=self.name)
         
@@ -119,16 +167,18 @@ class CloudServeAgent(BaseChatAgent):
         yield response
 
     async def on_reset(self, cancellation_token: CancellationToken) -> None:
-        pass
+        await self._model_context.clear()
 
-def create_team() -> SelectorGroupChat:
-    model_client = OpenAIChatCompletionClient(model="gpt-4o-mini")
-    cloudServeAgent = CloudServeAgent("CloudServeAgent")
+def create_team(session_id: str = "default", model_client: ChatCompletionClient | None = None, **coder_options) -> SelectorGroupChat:
+    """
+    Builds the planner/coder team. `model_client` replaces the OpenAI client of both agents,
+    e.g. with a scripted client for offline benchmarks; `coder_options` go to CloudServeAgent.
+    """
+    cloudServeAgent = CloudServeAgent("CloudServeAgent", session_id=session_id, model_client=model_client, **coder_options)
+    model_client = model_client if model_client is not None else get_model_client()
 
     termination = TextMentionTermination("APPROVE")
 
-    user = UserProxyAgent("UserAgent", input_func=input)
-
     selector_prompt = """Select an agent to perform task.
     {roles}
     Current conversation context:
@@ -141,7 +191,8 @@ def create_team() -> SelectorGroupChat:
     planning_agent = AssistantAgent(
         "PlanningAgent",
         description="An agent for planning tasks, this agent should be the first to engage when given a new task.",
-        model_client=model_client,
+        model_client=TracedChatCompletionClient(model_client, "planner"),
+        model_context=TokenBudgetedChatCompletionContext(model_client),
         system_message="""
         You are a planning agent your responsibility is to give task to CloudServeAgent and evaluate if task is completed.
         After all tasks are complete, summarize the findings and end with "APPROVE".
@@ -150,9 +201,10 @@ def create_team() -> SelectorGroupChat:
 
     team = SelectorGroupChat(
         [planning_agent, cloudServeAgent],
-        model_client=model_client,
+        model_client=TracedChatCompletionClient(model_client, "selector_llm"),
         termination_condition=termination,
         selector_prompt=selector_prompt,
+        selector_func=planner_coder_selector(),  # The LLM selector only runs when no rule applies
         max_turns=2,
         allow_repeated_speaker=False,  # Allow an agent to speak multiple turns in a row.
     )
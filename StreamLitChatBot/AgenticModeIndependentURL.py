@@ -1,137 +1,353 @@
-import pandas as pd
-import os
-import re
+import hashlib
+import logging
 import time
 import uuid
+from dataclasses import dataclass
 from dotenv import load_dotenv
 from pathlib import Path
-from typing import AsyncGenerator, Sequence
-from PIL import Image
+from typing import AsyncGenerator, List, Sequence, Tuple
 import asyncio
 
-from autogen_agentchat.agents import BaseChatAgent, UserProxyAgent, AssistantAgent
+from autogen_agentchat.agents import BaseChatAgent, AssistantAgent
 from autogen_agentchat.base import Response
-from autogen_agentchat.messages import ChatMessage,TextMessage
+from autogen_agentchat.messages import AgentEvent, ChatMessage, ModelClientStreamingChunkEvent, TextMessage
 from autogen_core import CancellationToken
-from autogen_core.code_executor import CodeBlock
-from autogen_ext.code_executors.local import LocalCommandLineCodeExecutor
-from autogen_ext.models.openai import OpenAIChatCompletionClient
-from autogen_core.model_context import UnboundedChatCompletionContext
-from autogen_core.models import SystemMessage, UserMessage
-from autogen_agentchat.ui import Console
+from autogen_core.code_executor import CodeBlock, CodeResult
+from autogen_core.models import AssistantMessage, ChatCompletionClient, RequestUsage, SystemMessage, UserMessage
 from autogen_agentchat.teams import SelectorGroupChat
 from autogen_agentchat.conditions import TextMentionTermination
+from response_cache import CacheLookup, ResponseCache, get_response_cache
+from artifact_store import ExecutionCache
+from warm_executor import WarmPoolCodeExecutor, WarmWorkerPool
+from code_repair import AttemptRecord, RepairPolicy, RepairSession, extract_code, fence_code
+from candidate_race import race_candidates
+from token_budget_context import TokenBudgetedChatCompletionContext
+from speaker_selection import planner_coder_selector
+from execution_result import ExecutionResult
+from output_capture import OUTPUT_FILENAME, capture_file, spool_text
+from workspace import WorkspaceManager, get_workspace_manager
+from manifest import ManifestCodeResult, snapshot
+from telemetry import span
+from traced_client import TracedChatCompletionClient, usage_attributes
+from execution_scheduler import EX_TEMPFAIL, ExecutionRejected, ExecutionScheduler, get_execution_scheduler
+from model_pool import get_model_client
+from dataset_store import Dataset, DatasetStore, get_dataset_store
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+@dataclass
+class _Candidate:
+    language: str
+    code: str
+    result: CodeResult
+    work_dir: Path
+    usage: RequestUsage
+    generation_seconds: float
+    execution_seconds: float
+
 class CloudServeAgent(BaseChatAgent):
     def __init__(
         self,
         name: str,
         description: str = "An agent that generates a DataFrame and a matplotlib plot based on user inputs.",
-        work_dir: Path = Path("cloudserve")
+        work_dir: Path = Path("cloudserve"),
+        response_cache: ResponseCache | None = None,
+        execution_cache: ExecutionCache | None = None,
+        worker_pool: WarmWorkerPool | None = None,
+        repair_policy: RepairPolicy | None = None,
+        candidates: int = 1,
+        session_id: str = "default",
+        workspace: WorkspaceManager | None = None,
+        model_client: ChatCompletionClient | None = None,
+        scheduler: ExecutionScheduler | None = None,
+        dataset_store: DatasetStore | None = None,
     ):
         super().__init__(name=name, description=description)
         self.work_dir = work_dir
-        self.work_dir.mkdir(exist_ok=True)
-        self._model_client = OpenAIChatCompletionClient(model="gpt-4o-mini")
+        self._workspace = workspace if workspace is not None else get_workspace_manager(work_dir)
+        self._session_id = session_id
+        self._model_client = model_client if model_client is not None else get_model_client()
+        self._response_cache = response_cache if response_cache is not None else get_response_cache()
+        self._execution_cache = execution_cache if execution_cache is not None else ExecutionCache()
+        self._worker_pool = worker_pool
+        self._scheduler = scheduler if scheduler is not None else get_execution_scheduler()
+        self._dataset_store = dataset_store if dataset_store is not None else get_dataset_store()
+        self.datasets: List[Dataset] = []  # Uploaded tables of the current request
+        self._repair_policy = repair_policy if repair_policy is not None else RepairPolicy()
+        self.attempts: List[AttemptRecord] = []
+        self._candidates = candidates  # Above 1, the first attempt races this many scripts
         self._system_message = [SystemMessage(content="""Write Only Python code what user asks for, don't write anything else than code. Save outputs in current working directory. Always use PNG images to save images.""")]
         self.code='print(''Hello, World!'')'
         self.language='python'
         
+    async def _generate_stream(self, conversation_history, lookup: CacheLookup | None, cancellation_token: CancellationToken) -> AsyncGenerator[ModelClientStreamingChunkEvent | Tuple[str, RequestUsage | None], None]:
+        """
+        Streams the model's answer for `conversation_history` as chunk events, then yields
+        a final (content, usage) tuple. A cache hit in `lookup` is replayed instead and has no usage.
+        """
+        with span("code_generation", messages=len(conversation_history)) as current:
+            cached = lookup.content if lookup is not None else None
+            current.set_attribute("cached", cached is not None)
+            if cached is not None:
+                yield ModelClientStreamingChunkEvent(content=cached, source=self.name)
+                yield cached, None
+                return
+            response = None
+            async for chunk in self._model_client.create_stream(conversation_history, cancellation_token=cancellation_token):
+                if isinstance(chunk, str):
+                    yield ModelClientStreamingChunkEvent(content=chunk, source=self.name)
+                else:
+                    response = chunk
+            for key, value in usage_attributes(response.usage).items():
+                current.set_attribute(key, value)
+        yield response.content, response.usage
+
+    async def _update_response_cache(self, lookup: CacheLookup, result: CodeResult, cancellation_token: CancellationToken) -> None:
+        """
+        Caches the code that ran successfully under the original prompt, or drops a cached answer whose code failed.
+        """
+        if result.exit_code == 0:
+            verified = fence_code(self.language, self.code)
+            if verified != lookup.content:
+                await self._response_cache.store(lookup, verified)
+        elif lookup.content is not None and result.exit_code != EX_TEMPFAIL and not cancellation_token.is_cancelled():
+            await self._response_cache.discard(lookup)
+
+    async def _execute(self, language: str, code: str, work_dir: Path, cancellation_token: CancellationToken) -> CodeResult:
+        """
+        `_execute_stream` without the status lines.
+        """
+        async for item in self._execute_stream(language, code, work_dir, cancellation_token):
+            if isinstance(item, CodeResult):
+                result = item
+        return result
+
+    async def _execute_stream(self, language: str, code: str, work_dir: Path, cancellation_token: CancellationToken) -> AsyncGenerator[ModelClientStreamingChunkEvent | CodeResult, None]:
+        """
+        Runs one code block in `work_dir`, reusing a cached run of identical code when there is one.
+        Yields status lines, then the CodeResult; the queue status is only reported on a cache miss,
+        because cached runs never wait for an execution slot.
+        """
+        output_path = work_dir / OUTPUT_FILENAME
+        with span("execution", language=language) as current:
+            try:
+                output_path.unlink(missing_ok=True)  # The spool file always belongs to the latest run
+                if self.datasets:
+                    await asyncio.to_thread(DatasetStore.link_into, self.datasets, work_dir)
+                cache_key = ExecutionCache.key(language, code, input_hashes=[dataset.hash for dataset in self.datasets])
+                try:
+                    result = await asyncio.to_thread(self._execution_cache.restore, cache_key, work_dir)
+                except Exception:
+                    # E.g. the entry was evicted while its files were being linked; run the code instead
+                    logger.warning("Execution cache restore failed for %s", cache_key, exc_info=True)
+                    result = None
+                current.set_attribute("cached", result is not None)
+                if result is None:
+                    if self._scheduler.free_slots == 0:
+                        yield self._progress(f"All execution slots are busy, queued behind {self._scheduler.queued} job(s)...")
+                    else:
+                        yield self._progress("Running code...")
+                    async with self._scheduler.enqueue(self._session_id):
+                        result = await WarmPoolCodeExecutor(work_dir=work_dir, pool=self._worker_pool).execute_code_blocks(
+                            code_blocks=[CodeBlock(language=language, code=code)],
+                            cancellation_token=cancellation_token,
+                        )
+                    if not output_path.exists():
+                        await asyncio.to_thread(spool_text, result.output, output_path)
+                    code_file = f"tmp_code_{hashlib.sha256(code.encode()).hexdigest()}.py"
+                    try:
+                        await asyncio.to_thread(self._execution_cache.save, cache_key, result, work_dir, [code_file])
+                    except Exception:
+                        logger.warning("Execution cache save failed for %s", cache_key, exc_info=True)  # The run itself succeeded
+            except ExecutionRejected as e:
+                result = CodeResult(exit_code=EX_TEMPFAIL, output=f"Execution rejected because the server is busy ({e}). Please try again shortly.")
+                work_dir.mkdir(parents=True, exist_ok=True)
+                await asyncio.to_thread(spool_text, result.output, output_path)
+            except Exception as e:
+                result = CodeResult(exit_code=1, output=str(e))
+                work_dir.mkdir(parents=True, exist_ok=True)
+                await asyncio.to_thread(spool_text, result.output, output_path)
+            current.set_attribute("exit_code", result.exit_code)
+        yield result
+
+    async def _run_candidate(self, conversation_history, work_dir: Path, seed: int, cancellation_token: CancellationToken) -> _Candidate:
+        """
+        Generates and runs one independent candidate script for the race mode. Each candidate
+        gets its own `seed`, so the pooled client does not coalesce the identical prompts into one call.
+        """
+        generation_started = time.monotonic()
+        with span("code_generation", messages=len(conversation_history), candidate=work_dir.name) as current:
+            response = await self._model_client.create(
+                conversation_history, extra_create_args={"seed": seed}, cancellation_token=cancellation_token
+            )
+            for key, value in usage_attributes(response.usage).items():
+                current.set_attribute(key, value)
+        generation_seconds = time.monotonic() - generation_started
+        language, code = extract_code(response.content)
+        execution_started = time.monotonic()
+        result = await self._execute(language, code, work_dir, cancellation_token)
+        return _Candidate(language, code, result, work_dir, response.usage, generation_seconds, time.monotonic() - execution_started)
+
+    def _progress(self, text: str) -> ModelClientStreamingChunkEvent:
+        """
+        Status line rendered inline with the streamed code.
+        """
+        return ModelClientStreamingChunkEvent(content=f"\n\n_{text}_\n\n", source=self.name)
+
     @property
     def produced_message_types(self) -> Sequence[type[ChatMessage]]:
         return (TextMessage,)
 
     async def on_messages(self, messages: Sequence[ChatMessage], cancellation_token: CancellationToken) -> Response:
-        content = ''
-        self._model_context = UnboundedChatCompletionContext()  # Clear context on each new request
+        response = None
+        async for message in self.on_messages_stream(messages, cancellation_token):
+            if isinstance(message, Response):
+                response = message  # Keep draining so the stream's spans and lease close here
+        if response is None:
+            raise AssertionError("The stream should have returned the final result.")
+        return response
+
+    async def on_messages_stream(self, messages: Sequence[ChatMessage], cancellation_token: CancellationToken) -> AsyncGenerator[AgentEvent | Response, None]:
         request_uuid = str(uuid.uuid4())  # Generate a UUID for this request
-        
-        for msg in messages:
-            await self._model_context.add_message(UserMessage(content=msg.content, source=msg.source))
-        
+        uuid_dir = self._workspace.acquire(self._session_id, request_uuid)
+        try:
+            with span("coder_request", session=self._session_id, request=request_uuid) as current:
+                async for message in self._handle_request(messages, request_uuid, uuid_dir, cancellation_token):
+                    if isinstance(message, Response):
+                        current.set_attribute("attempts", len(self.attempts))
+                        current.set_attribute("retries", self.attempts[-1].round - 1 if self.attempts else 0)
+                    yield message
+        finally:
+            self._workspace.release(uuid_dir)
+
+    async def _handle_request(self, messages: Sequence[ChatMessage], request_uuid: str, uuid_dir: Path, cancellation_token: CancellationToken) -> AsyncGenerator[AgentEvent | Response, None]:
         conversation_history = self._system_message[:]
+        self.datasets = self._dataset_store.datasets(self._session_id)
+        if self.datasets:
+            # Schema and sample only; the script reads the files from its working directory
+            summaries = "\n\n".join(dataset.summary() for dataset in self.datasets)
+            conversation_history.append(SystemMessage(content=f"The user uploaded these data files to the working directory:\n\n{summaries}"))
         for msg in messages:
             conversation_history.append(UserMessage(content=msg.content, source="user"))
         
-        response = await self._model_client.create(conversation_history, cancellation_token=cancellation_token)
-        initial_response_content = response.content
-        
-        pattern = re.compile(r"```(\w*)\n(.*?)```", re.DOTALL)
-        matches = pattern.findall(initial_response_content)
-        
-        if matches:
-            self.language, self.code = matches[-1]  # Take last code block
-            if not self.language:
-                self.language = "python"
-        else:
-            self.language = "python"
-            self.code = initial_response_content.strip()
-        
-        while True:
-            try:
-                code_block = CodeBlock(language=self.language, code=self.code)
-                result = await LocalCommandLineCodeExecutor(work_dir=self.work_dir/request_uuid).execute_code_blocks(
-                    code_blocks=[code_block],
-                    cancellation_token=cancellation_token,
+        repair = RepairSession(self._repair_policy)
+        result_dir = uuid_dir
+        result = None
+        lookup = await self._response_cache.lookup(conversation_history)  # Keyed by the original prompt only
+
+        if self._candidates > 1 and lookup.content is None:
+            yield self._progress(f"Racing {self._candidates} candidate scripts...")
+            winner, finished = await race_candidates(
+                lambda index, token: self._run_candidate(conversation_history, uuid_dir / f"candidate-{index}", index, token),
+                self._candidates,
+                lambda candidate: candidate.result.exit_code == 0,
+                cancellation_token,
+            )
+            for index, candidate in enumerate(finished):
+                # One repair round for the whole race, so a failed race still leaves room for fixes
+                repair.record(
+                    candidate.code, candidate.result.exit_code, candidate.generation_seconds, candidate.execution_seconds, candidate.usage,
+                    same_round=index > 0,
                 )
-                df_output = {
-                    "exit_code": result.exit_code if hasattr(result, 'exit_code') else "N/A",
-                    "error_message": result.stderr[:50] if hasattr(result, 'stderr') else "No error message",
-                    "stdout": result.stdout if hasattr(result, 'stdout') else str(result)
-                }
-                break
-            except Exception as e:
-                error_details = str(e)
-                conversation_history.append(UserMessage(content=f"Error: {error_details}", source="user"))
-                fix_response = await self._model_client.create(conversation_history, cancellation_token=cancellation_token)
-                fixed_response_content = fix_response.content
-                
-                matches = pattern.findall(fixed_response_content)
-                if matches:
-                    self.language, self.code = matches[-1]
-                    if not self.language:
-                        self.language = "python"
+            best = winner or (finished[-1] if finished else None)
+            if best is not None:
+                self.language, self.code, result, result_dir = best.language, best.code, best.result, best.work_dir
+                yield self._progress(f"Candidate {best.work_dir.name} finished with exit code {result.exit_code}")
+
+        while result is None or (result.exit_code != 0 and repair.can_retry()):
+            if result is None:
+                yield self._progress("Generating code...")
+            else:
+                # The failed script, also when it came from the race, so the model sees what to fix
+                conversation_history.append(AssistantMessage(content=fence_code(self.language, self.code), source=self.name))
+                conversation_history.append(UserMessage(content=repair.feedback(result.exit_code, result.output), source="user"))
+                yield self._progress(f"Execution failed with exit code {result.exit_code}, asking for a fix (attempt {repair.rounds + 1})...")
+            generation_started = time.monotonic()
+            async for item in self._generate_stream(conversation_history, lookup if result is None else None, cancellation_token):
+                if isinstance(item, ModelClientStreamingChunkEvent):
+                    yield item
+                else:
+                    response_content, usage = item
+            generation_seconds = time.monotonic() - generation_started
+
+            language, code = extract_code(response_content)
+            if repair.is_repeat(code):
+                break  # The model returned code that already failed; running it again cannot help
+            self.language, self.code = language, code
+
+            execution_started = time.monotonic()
+            async for item in self._execute_stream(self.language, self.code, uuid_dir, cancellation_token):
+                if isinstance(item, CodeResult):
+                    result = item
                 else:
-                    self.language = "python"
-                    self.code = fixed_response_content.strip()
+                    yield item
+            result_dir = uuid_dir
+            attempt = repair.record(self.code, result.exit_code, generation_seconds, time.monotonic() - execution_started, usage)
+            if result.exit_code == EX_TEMPFAIL:
+                yield self._progress("The server is busy, execution was rejected")
+                break  # Load shedding: asking the model for a fix cannot help
+            yield self._progress(f"Execution finished with exit code {result.exit_code} in {attempt.execution_seconds:.2f}s")
+
+        self.attempts = repair.attempts
+        await self._update_response_cache(lookup, result, cancellation_token)
         image_urls = []
         other_files = []
         code_file=""
-        uuid_dir = self.work_dir / request_uuid
-        uuid_dir.mkdir(exist_ok=True)
-        
-        for file in uuid_dir.iterdir():
-            if file.suffix.lower() in [".png", ".jpg", ".jpeg"]:
-                image_urls.append(str(file))
-            elif file.suffix.lower() in [".py"]:
-                code_file = file
+        final_code_file = result_dir / f"tmp_code_{hashlib.sha256(self.code.encode()).hexdigest()}.py"
+        with span("artifact_scan", manifest=isinstance(result, ManifestCodeResult)) as current:
+            if isinstance(result, ManifestCodeResult):
+                produced = result.files
             else:
-                other_files.append(file)
-                
-        result_output = df_output if df_output else "No output"
-        
-        content = f'''{{"uuid": "{request_uuid}",
-            "image_urls": {image_urls},
-            "code": "{code_file}",
-            "result": "{df_output}",
-            "other_files": "{other_files}"}}'''
+                produced = list(await asyncio.to_thread(snapshot, result_dir))  # No manifest, e.g. the executor raised
+
+            for name in produced:
+                file = result_dir / name
+                if file.name == OUTPUT_FILENAME:
+                    continue
+                if file.suffix.lower() in [".png", ".jpg", ".jpeg"]:
+                    image_urls.append(str(file))
+                elif file.suffix.lower() in [".py"]:
+                    if not code_file or file == final_code_file:
+                        code_file = str(file)
+                else:
+                    other_files.append(str(file))
+
+            output = await asyncio.to_thread(capture_file, result_dir / OUTPUT_FILENAME)
+            current.set_attribute("files", len(produced))
+        for url in image_urls:
+            yield self._progress(f"Artifact ready: {Path(url).name}")
+        content = ExecutionResult(
+            uuid=request_uuid,
+            image_urls=image_urls,
+            code=code_file,
+            exit_code=result.exit_code,
+            stdout=output.preview(),
+            stdout_bytes=output.total_bytes,
+            stdout_path=output.path,
+            error_message=result.output[-200:] if result.exit_code != 0 else "",
+            other_files=other_files,
+        ).to_json()
         
-        return Response(chat_message=TextMessage(content=content, source=self.name), inner_messages=[])
-    
-    async def on_messages_stream(self, messages: Sequence[ChatMessage], cancellation_token: CancellationToken) -> AsyncGenerator[Response, None]:
-        response = await self.on_messages(messages, cancellation_token)
-        yield response
+        # Usage of every attempt, so consoles with output_stats count the coder's tokens too
+        usage = RequestUsage(
+            prompt_tokens=sum(attempt.prompt_tokens for attempt in self.attempts),
+            completion_tokens=sum(attempt.completion_tokens for attempt in self.attempts),
+        )
+        yield Response(chat_message=TextMessage(content=content, source=self.name, models_usage=usage), inner_messages=[])
     
     async def on_reset(self, cancellation_token: CancellationToken) -> None:
         pass
 
-def create_team() -> SelectorGroupChat:
-    model_client = OpenAIChatCompletionClient(model="gpt-4o-mini")
-    cloudServeAgent = CloudServeAgent("CloudServeAgent")
+def create_team(session_id: str = "default", model_client: ChatCompletionClient | None = None, **coder_options) -> SelectorGroupChat:
+    """
+    Builds the planner/coder team. `model_client` replaces the OpenAI client of both agents,
+    e.g. with a scripted client for offline benchmarks; `coder_options` go to CloudServeAgent.
+    """
+    cloudServeAgent = CloudServeAgent("CloudServeAgent", session_id=session_id, model_client=model_client, **coder_options)
+    model_client = model_client if model_client is not None else get_model_client()
     termination = TextMentionTermination("APPROVE")
-    user = UserProxyAgent("UserAgent", input_func=input)
 
     selector_prompt = """Select an agent to perform task.
     {roles}
@@ -145,7 +361,8 @@ def create_team() -> SelectorGroupChat:
     planning_agent = AssistantAgent(
         "PlanningAgent",
         description="An agent for planning tasks, this agent should be the first to engage when given a new task.",
-        model_client=model_client,
+        model_client=TracedChatCompletionClient(model_client, "planner"),
+        model_context=TokenBudgetedChatCompletionContext(model_client),
         system_message="""
         Decide wether to just engage with User or Delegate task to CloudServeAgent
         You are a planning agent. Your responsibility is to give tasks to CloudServeAgent and evaluate if the task is completed.
@@ -155,9 +372,10 @@ def create_team() -> SelectorGroupChat:
 
     team = SelectorGroupChat(
         [planning_agent, cloudServeAgent],
-        model_client=model_client,
+        model_client=TracedChatCompletionClient(model_client, "selector_llm"),
         termination_condition=termination,
         selector_prompt=selector_prompt,
+        selector_func=planner_coder_selector(),  # The LLM selector only runs when no rule applies
         max_turns=2,
         allow_repeated_speaker=False,
     )
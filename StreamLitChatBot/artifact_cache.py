@@ -0,0 +1,37 @@
+import functools
+import io
+import os
+from typing import Tuple
+
+THUMBNAIL_SIZE = (480, 480)
+
+
+@functools.lru_cache(maxsize=256)
+def _thumbnail(path: str, mtime_ns: int, max_size: Tuple[int, int]) -> bytes:
+    from PIL import Image
+
+    with Image.open(path) as image:
+        image.thumbnail(max_size)
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@functools.lru_cache(maxsize=128)
+def _read_text(path: str, mtime_ns: int) -> str:
+    with open(path, "r") as file:
+        return file.read()
+
+
+def thumbnail_bytes(path: str, max_size: Tuple[int, int] = THUMBNAIL_SIZE) -> bytes:
+    """
+    PNG thumbnail of the image at `path`, generated once per (path, mtime) and shared by all sessions.
+    """
+    return _thumbnail(path, os.stat(path).st_mtime_ns, tuple(max_size))
+
+
+def read_text(path: str) -> str:
+    """
+    Contents of a text artifact such as a generated code file, memoized per (path, mtime).
+    """
+    return _read_text(path, os.stat(path).st_mtime_ns)
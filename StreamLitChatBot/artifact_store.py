@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Iterable, Optional
+
+from autogen_core.code_executor import CodeResult
+
+from manifest import ManifestCodeResult
+
+
+def _place(src: Path, dest: Path) -> None:
+    """
+    Hard-links `src` to `dest`, falling back to a copy across filesystems.
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+class ExecutionCache:
+    """
+    Content-addressed store of code execution results.
+
+    The key is the hash of (language, code, input file contents or precomputed input hashes,
+    such as uploaded dataset digests). A hit restores the stored
+    exit code and output and links the files produced by the original run into the new
+    request directory, so byte-identical scripts are not executed again. Only successful
+    runs are stored; the least recently used entries are evicted beyond `max_bytes`.
+    """
+
+    def __init__(self, root: Path = Path("cloudserve_cache") / "executions", *, max_bytes: int = 512 * 1024 * 1024):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+
+    @staticmethod
+    def key(language: str, code: str, input_files: Iterable[Path] = (), input_hashes: Iterable[str] = ()) -> str:
+        digest = hashlib.sha256()
+        digest.update(language.lower().encode())
+        digest.update(b"\0")
+        digest.update(code.encode())
+        for path in sorted(Path(p) for p in input_files):
+            digest.update(b"\0")
+            digest.update(path.name.encode())
+            digest.update(hashlib.sha256(path.read_bytes()).digest())
+        for input_hash in sorted(input_hashes):
+            digest.update(b"\0")
+            digest.update(input_hash.encode())
+        return digest.hexdigest()
+
+    def restore(self, key: str, dest: Path) -> Optional[ManifestCodeResult]:
+        """
+        Links the stored artifacts for `key` into `dest` and returns the stored result, or None on a miss.
+        """
+        entry = self.root / key
+        meta_path = entry / "meta.json"
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            return None
+        dest.mkdir(parents=True, exist_ok=True)
+        for name in meta["files"]:
+            target = dest / name
+            if not target.exists():
+                _place(entry / "files" / name, target)
+        os.utime(meta_path)  # Mark as recently used
+        return ManifestCodeResult(exit_code=meta["exit_code"], output=meta["output"], files=meta["files"])
+
+    def save(self, key: str, result: CodeResult, src: Path, extra_files: Iterable[str] = ()) -> None:
+        """
+        Stores `result` with the files the run produced in `src`, plus `extra_files` such as the
+        script itself. Only a `ManifestCodeResult` says which files those are; other results are
+        not stored, because leftovers of earlier attempts in `src` would pass for their outputs.
+        """
+        if result.exit_code != 0 or not isinstance(result, ManifestCodeResult) or (self.root / key).exists():
+            return
+        staging = self.root / f".tmp-{uuid.uuid4().hex}"
+        files, size = [], 0
+        for name in sorted(set(result.files) | set(extra_files)):
+            path = src / name
+            if path.is_file() and not path.is_symlink():  # Linked inputs such as datasets are not outputs
+                _place(path, staging / "files" / name)
+                files.append(name)
+                size += path.stat().st_size
+        staging.mkdir(parents=True, exist_ok=True)
+        (staging / "meta.json").write_text(
+            json.dumps({"exit_code": result.exit_code, "output": result.output, "files": files, "size": size})
+        )
+        try:
+            staging.rename(self.root / key)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)  # Another request stored the same key first
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        total = 0
+        for entry in self.root.iterdir():
+            meta_path = entry / "meta.json"
+            if entry.name.startswith(".") or not meta_path.exists():
+                continue
+            size = json.loads(meta_path.read_text())["size"]
+            entries.append((meta_path.stat().st_mtime, size, entry))
+            total += size
+        for _, size, entry in sorted(entries, key=lambda item: item[0]):
+            if total <= self._max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
@@ -1,72 +1,22 @@
-import streamlit as st
-from autogen_core import CancellationToken
-from AgenticModeIndependentURL import create_team
-from streamlit_console import StreamlitConsole
-import asyncio
-
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-
-AgenticTeam = create_team()
-
-st.title("🤖 Streamlit Chatbot")
-user_input = st.chat_input("Say something...")
-
-with st.sidebar:
-    st.title("Chat Options")
-    st.write("Customize your chat experience here.")
+import time
+rerun_started = time.perf_counter()
 
-chat_container = st.container()
+import streamlit as st
+import uuid
+from event_loop import get_background_loop
+from functools import partial
+from history_store import ChatHistory, collect_histories
+from dataset_store import READERS, get_dataset_store
+from pathlib import Path
+from streamlit_console import StreamlitConsoleSync, render_execution_result, render_text_message
+from team_registry import TeamRegistry
+from telemetry import span, start_metrics_server
+from startup import record_rerun, report, timed_import
+from workspace import get_workspace_manager
 
-with chat_container:
-    st.divider()
-    for msg in st.session_state.messages:
-        role = msg["role"]
-        content = msg["content"]
-        avatar = "🧑‍💻" if role == "user" else "🤖"
-        
-        if role == "user":
-            st.markdown(f'<div class="user-message">{content} {avatar}</div>', unsafe_allow_html=True)
-        else:
-            content_data=msg["content"]
-            st.markdown(f'<div class="bot-message">{avatar}</div>', unsafe_allow_html=True)
-            if isinstance(content_data, dict):
-                        if "uuid" in content_data:
-                            st.subheader(f"Directory: {content_data['uuid']}")
-
-                        if "code" in content_data:
-                            st.write("### Code File:")
-                            try:
-                                with open(content_data["code"], "r") as code_file:
-                                    code_content = code_file.read()
-                                st.code(code_content, language="python")
-                            except Exception as e:
-                                st.error(f"Could not load code file: {e}")
-
-                        if "image_urls" in content_data and isinstance(content_data["image_urls"], list):
-                            st.write("### Images:")
-                            for url in content_data["image_urls"]:
-                                try:
-                                    image_name = url.split("/")[-1]
-                                    st.write(f"**Image Name:** {image_name}")
-                                    st.image(url)
-                                except Exception as e:
-                                    st.error(f"Could not load image: {e}")
-                        if "result" in content_data:
-                            if content_data["result"]["exit_code"] == 0:
-                                st.success("Execution succeeded")
-                            else:
-                                st.error(f"Execution failed with exit code: {content_data['result']['exit_code']}")
-
-            elif isinstance(content_data, list):
-                st.write("### List Content:")
-                for idx, item in enumerate(content_data):
-                    st.write(f"{idx + 1}. {item}")
-
-            else:
-                st.markdown(f'<div class="bot-message">{content}</div>', unsafe_allow_html=True)
-
-st.markdown("""
+EAGER_MESSAGES = 6  # Older results render collapsed until expanded
+HISTORY_DIR = Path("cloudserve_cache") / "history"
+CHAT_CSS = """
     <style>
     .user-message {
         text-align: right;
@@ -81,9 +31,110 @@ st.markdown("""
         margin: 5px;
     }
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+@st.cache_resource
+def get_team_registry() -> TeamRegistry:
+    """
+    One registry per server process, shared by every session. The agent modules (autogen,
+    openai) are imported here, on the first message, instead of on the first page render.
+    """
+    return TeamRegistry(timed_import("AgenticModeIndependentURL").create_team)
+
+@st.cache_resource
+def get_metrics_server():
+    """
+    `/metrics` endpoint for the stage timings and token counters, started once per process.
+    """
+    return start_metrics_server()
+
+@st.cache_resource
+def start_history_gc() -> None:
+    """
+    Histories of abandoned sessions are removed by the workspace GC, on the same age limit as their request directories.
+    """
+    get_workspace_manager().add_collector(partial(collect_histories, HISTORY_DIR))
+
+get_metrics_server()
+start_history_gc()
+
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+
+if "history" not in st.session_state:
+    st.session_state.history = ChatHistory(HISTORY_DIR / st.session_state.session_id)
+
+st.title("🤖 Streamlit Chatbot")
+user_input = st.chat_input("Say something...")
+
+with st.sidebar:
+    st.title("Chat Options")
+    st.write("Customize your chat experience here.")
+    uploads = st.file_uploader(
+        "Data files", type=[suffix.lstrip(".") for suffix in READERS], accept_multiple_files=True
+    )
+    if "datasets" not in st.session_state:
+        st.session_state.datasets = {}  # Upload file_id -> Dataset, so reruns do not re-ingest
+    datasets = []
+    for upload in uploads or []:
+        if upload.file_id not in st.session_state.datasets:
+            try:
+                st.session_state.datasets[upload.file_id] = get_dataset_store().ingest(upload.name, upload.getvalue())
+            except (ImportError, OSError, ValueError) as e:
+                st.error(f"Could not read {upload.name}: {e}")
+                continue
+        dataset = st.session_state.datasets[upload.file_id]
+        datasets.append(dataset)
+        st.caption(f"`{dataset.name}`: {dataset.rows:,} rows, {len(dataset.columns)} columns")
+    get_dataset_store().set_datasets(st.session_state.session_id, datasets)
+
+    with st.expander("Performance"):
+        timings = report()
+        st.caption(
+            f"Reruns: {timings['reruns']}, last {timings['last_rerun'] * 1000:.0f} ms, "
+            f"median {timings['median_rerun'] * 1000:.0f} ms, max {timings['max_rerun'] * 1000:.0f} ms"
+        )
+        for module, seconds in timings["deferred_imports"]:
+            st.caption(f"Import `{module}`: {seconds * 1000:.0f} ms")
+
+chat_container = st.container()
+
+with chat_container:
+    st.divider()
+    history = st.session_state.history
+    if history.has_older() and st.button("Load older messages"):
+        history.load_older()
+    visible = history.visible()
+    first_eager = len(visible) - EAGER_MESSAGES
+    for index, entry in enumerate(visible):
+        result = history.result(entry)
+        if result is None:
+            render_text_message(entry.role, entry.text)
+        else:
+            st.markdown('<div class="bot-message">🤖</div>', unsafe_allow_html=True)
+            render_execution_result(result, expanded=index >= first_eager)
+
+st.markdown(CHAT_CSS, unsafe_allow_html=True)  # Streamlit rebuilds the page on every rerun, so this is re-sent
+record_rerun(time.perf_counter() - rerun_started)  # Page overhead only; the agent turn is traced separately
 
 if user_input:
-    response = asyncio.run(StreamlitConsole(AgenticTeam.run_stream(task=user_input)))
+    AgenticTeam = get_team_registry().get(st.session_state.session_id)
+    from autogen_core import CancellationToken  # Loaded with the team above, not on first render
+
+    # One turn per team at a time. A rerun cancels the turn's token, which stops its in-flight
+    # agent replies and model calls; the next turn waits only for that shutdown. Messages the
+    # cancelled turn already produced stay in the team's thread.
+    cancellation_token = CancellationToken()
+    with span("turn", session=st.session_state.session_id):
+        # Started inside the span: the background task copies this context, so the agents' spans nest under the turn
+        handle = get_background_loop().stream(
+            AgenticTeam.run_stream(task=user_input, cancellation_token=cancellation_token),
+            exclusive=AgenticTeam,
+            cancellation_token=cancellation_token,
+        )
+        try:
+            response = StreamlitConsoleSync(handle)
+        finally:
+            handle.cancel()
 
 # st.rerun()
@@ -0,0 +1,249 @@
+"""
+Offline benchmark for the planner/coder team.
+
+Drives `create_team()` with a scripted stand-in for the OpenAI client, so no network access or
+API key is needed, and reports turn latency, execution time, retries and memory:
+
+    python benchmark.py --sessions 8 --concurrency 4 --latency 0.3 --max-p95 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncGenerator, Dict, List, Mapping, Optional, Sequence, Union
+
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")  # create_team never reaches OpenAI here
+
+from autogen_core import CancellationToken
+from autogen_core.models import CreateResult, LLMMessage, SystemMessage, UserMessage
+from autogen_core.tools import Tool, ToolSchema
+from autogen_ext.models.replay import ReplayChatCompletionClient
+
+from AgenticModeIndependentURL import CloudServeAgent, create_team
+from artifact_store import ExecutionCache
+from dataset_store import DatasetStore
+from response_cache import ResponseCache
+
+CODER_PROMPT_PREFIX = "Write Only Python code"
+REPAIR_PROMPT_PREFIX = "Error: the code exited"  # Start of RepairSession.feedback()
+
+
+@dataclass
+class BenchmarkPrompt:
+    """
+    One corpus entry: the user prompt and the coder's scripted answers, one per attempt.
+    """
+
+    prompt: str
+    scripts: List[str]
+
+
+CORPUS = [
+    BenchmarkPrompt(
+        "Create a DataFrame of five countries and their population and print it",
+        ["```python\nimport pandas as pd\ndf = pd.DataFrame({'country': list('ABCDE'), 'population': [5, 4, 3, 2, 1]})\nprint(df)\n```"],
+    ),
+    BenchmarkPrompt(
+        "Plot a bar chart of monthly sales generated yourself",
+        [
+            "```python\nimport matplotlib.pyplot as plt\nplt.bar(range(12), [m * 3 % 7 for m in range(12)])\nplt.savefig('sales.png')\n```"
+        ],
+    ),
+    BenchmarkPrompt(
+        "Compute summary statistics of a random series",
+        [
+            "```python\nimport pandas as pd\nprint(pd.Series(range(100)).describ())\n```",
+            "```python\nimport pandas as pd\nprint(pd.Series(range(100)).describe())\n```",
+        ],
+    ),
+    BenchmarkPrompt(
+        "Print the first ten thousand square numbers",
+        ["```python\nfor i in range(10000):\n    print(i * i)\n```"],
+    ),
+]
+
+
+class ScriptedChatCompletionClient(ReplayChatCompletionClient):
+    """
+    Deterministic stand-in for the pooled OpenAI client with configurable latency.
+
+    The answer is picked from the conversation instead of a fixed order: coder calls get the
+    script for the current prompt and attempt (one attempt per repair prompt so far), every
+    other call gets a short plan. `latency` is waited before the answer and `token_delay` between
+    streamed tokens.
+    """
+
+    def __init__(self, corpus: Sequence[BenchmarkPrompt], *, latency: float = 0.0, token_delay: float = 0.0):
+        super().__init__([])
+        self._scripts = {entry.prompt: entry.scripts for entry in corpus}
+        self._latency = latency
+        self._token_delay = token_delay
+
+    def _answer(self, messages: Sequence[LLMMessage]) -> str:
+        is_coder = any(isinstance(m, SystemMessage) and m.content.startswith(CODER_PROMPT_PREFIX) for m in messages)
+        user_messages = [m.content for m in messages if isinstance(m, UserMessage) and isinstance(m.content, str)]
+        prompt = next((text for text in reversed(user_messages) if text in self._scripts), None)
+        if not is_coder or prompt is None:
+            return f"CloudServeAgent, please handle this: {prompt or 'the user request'}"
+        scripts = self._scripts[prompt]
+        attempt = sum(1 for text in user_messages if text.startswith(REPAIR_PROMPT_PREFIX))
+        return scripts[min(attempt, len(scripts) - 1)]
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        await asyncio.sleep(self._latency)
+        # Appending and replaying happen without an await in between, so concurrent calls cannot swap answers
+        self.chat_completions.append(self._answer(messages))
+        return await super().create(
+            messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args, cancellation_token=cancellation_token
+        )
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        result = await self.create(
+            messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args, cancellation_token=cancellation_token
+        )
+        for token in result.content.split(" "):
+            await asyncio.sleep(self._token_delay)
+            yield token + " "
+        yield result
+
+
+@dataclass
+class TurnSample:
+    seconds: float
+    execution_seconds: float
+    retries: int
+    exit_code: int
+
+
+@dataclass
+class SessionReport:
+    session_id: str
+    turns: List[TurnSample] = field(default_factory=list)
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """
+    Nearest-rank percentile; 0.0 for no values.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def _coder(team) -> CloudServeAgent:
+    return next(agent for agent in team._participants if isinstance(agent, CloudServeAgent))
+
+
+async def run_session(index: int, turns: int, corpus: Sequence[BenchmarkPrompt], args, root: Path) -> SessionReport:
+    session_id = f"bench-{index}"
+    # Per-session caches by default, so later sessions measure the agent rather than cache hits
+    cache_root = root if args.shared_cache else root / "caches" / session_id
+    team = create_team(
+        session_id=session_id,
+        model_client=ScriptedChatCompletionClient(corpus, latency=args.latency, token_delay=args.token_delay),
+        work_dir=root / "work",
+        response_cache=ResponseCache(cache_root / "responses.sqlite"),
+        execution_cache=ExecutionCache(cache_root / "executions"),
+        dataset_store=DatasetStore(root / "datasets"),
+    )
+    coder = _coder(team)
+    report = SessionReport(session_id)
+    for turn in range(turns):
+        entry = corpus[(index + turn) % len(corpus)]
+        started = time.monotonic()
+        await team.run(task=entry.prompt)
+        report.turns.append(
+            TurnSample(
+                seconds=time.monotonic() - started,
+                execution_seconds=sum(attempt.execution_seconds for attempt in coder.attempts),
+                retries=coder.attempts[-1].round - 1 if coder.attempts else 0,
+                exit_code=coder.attempts[-1].exit_code if coder.attempts else -1,
+            )
+        )
+    return report
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    root = Path(args.root) if args.root else Path(tempfile.mkdtemp(prefix="cloudserve-bench-"))
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(index: int) -> SessionReport:
+        async with semaphore:
+            return await run_session(index, args.turns, CORPUS, args, root)
+
+    rss_before_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.monotonic()
+    try:
+        reports = await asyncio.gather(*(limited(index) for index in range(args.sessions)))
+    finally:
+        if not args.root:
+            shutil.rmtree(root, ignore_errors=True)
+    wall_seconds = time.monotonic() - started
+    rss_after_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    samples = [sample for report in reports for sample in report.turns]
+    latencies = [sample.seconds for sample in samples]
+    executions = [sample.execution_seconds for sample in samples]
+    return {
+        "sessions": args.sessions,
+        "shared_cache": args.shared_cache,
+        "concurrency": args.concurrency,
+        "turns": len(samples),
+        "failed_turns": sum(1 for sample in samples if sample.exit_code != 0),
+        "wall_seconds": round(wall_seconds, 3),
+        "turns_per_second": round(len(samples) / wall_seconds, 3) if wall_seconds else 0.0,
+        "turn_latency": {f"p{pct}": round(percentile(latencies, pct), 3) for pct in (50, 95, 99)},
+        "execution_seconds": {f"p{pct}": round(percentile(executions, pct), 3) for pct in (50, 95, 99)},
+        "retries": sum(sample.retries for sample in samples),
+        "peak_rss_mb": round(rss_after_kb / 1024, 1),
+        "rss_growth_per_session_mb": round((rss_after_kb - rss_before_kb) / 1024 / args.sessions, 2),
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=len(CORPUS), help="turns per session")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before each model answer")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed tokens")
+    parser.add_argument("--root", help="directory for caches and work dirs; a fresh temporary one by default")
+    parser.add_argument("--shared-cache", action="store_true", help="share the response and execution caches across sessions")
+    parser.add_argument("--max-p95", type=float, help="exit with status 1 when p95 turn latency exceeds this")
+    args = parser.parse_args(argv)
+
+    summary = asyncio.run(run_benchmark(args))
+    print(json.dumps(summary, indent=2))
+    if args.max_p95 is not None and summary["turn_latency"]["p95"] > args.max_p95:
+        print(f"p95 turn latency {summary['turn_latency']['p95']}s exceeds {args.max_p95}s", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
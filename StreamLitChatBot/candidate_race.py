@@ -0,0 +1,48 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+from autogen_core import CancellationToken
+
+T = TypeVar("T")
+
+
+async def race_candidates(
+    run_candidate: Callable[[int, CancellationToken], Awaitable[T]],
+    n: int,
+    is_success: Callable[[T], bool],
+    cancellation_token: CancellationToken,
+) -> Tuple[Optional[T], List[T]]:
+    """
+    Runs `n` candidates concurrently and returns as soon as one of them succeeds.
+
+    Every candidate gets its own cancellation token, linked to its task; once a winner is
+    found (or `cancellation_token` is cancelled) the remaining candidates are cancelled.
+    Returns the winner, or None, together with every candidate that finished, in finishing order.
+    """
+    tokens = [CancellationToken() for _ in range(n)]
+    tasks = [asyncio.ensure_future(run_candidate(index, tokens[index])) for index in range(n)]
+    for token, task in zip(tokens, tasks):
+        token.link_future(task)
+
+    def cancel_all() -> None:
+        for token in tokens:
+            token.cancel()
+
+    cancellation_token.add_callback(cancel_all)
+
+    winner: Optional[T] = None
+    finished: List[T] = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                candidate = await next_done
+            except Exception:
+                continue  # A failing candidate just drops out of the race
+            finished.append(candidate)
+            if is_success(candidate):
+                winner = candidate
+                break
+    finally:
+        cancel_all()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return winner, finished
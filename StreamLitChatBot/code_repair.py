@@ -0,0 +1,117 @@
+import hashlib
+import re
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from autogen_core.models import RequestUsage
+
+CODE_BLOCK_PATTERN = re.compile(r"```(\w*)\n(.*?)```", re.DOTALL)
+
+
+def extract_code(content: str) -> Tuple[str, str]:
+    """
+    Returns (language, code) of the last fenced code block in `content`, or the whole content as Python.
+    """
+    matches = CODE_BLOCK_PATTERN.findall(content)
+    if matches:
+        language, code = matches[-1]
+        return language or "python", code
+    return "python", content.strip()
+
+
+def fence_code(language: str, code: str) -> str:
+    """
+    Inverse of `extract_code`: `code` as a fenced block.
+    """
+    return f"```{language}\n{code.rstrip()}\n```"
+
+
+@dataclass
+class RepairPolicy:
+    """
+    Bounds for the generate -> execute -> fix loop.
+    """
+
+    max_attempts: int = 3
+    time_budget: float = 120.0
+    feedback_chars: int = 2000
+
+
+@dataclass
+class AttemptRecord:
+    attempt: int
+    code_hash: str
+    exit_code: int
+    generation_seconds: float
+    execution_seconds: float
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached: bool = False
+    round: int = 1  # Repair round; the candidates of a race share one
+
+
+@dataclass
+class RepairSession:
+    """
+    Tracks the attempts of one request and decides whether another repair round is allowed.
+    """
+
+    policy: RepairPolicy = field(default_factory=RepairPolicy)
+    attempts: List[AttemptRecord] = field(default_factory=list)
+    started: float = field(default_factory=time.monotonic)
+
+    @staticmethod
+    def code_hash(code: str) -> str:
+        return hashlib.sha256(code.strip().encode()).hexdigest()
+
+    def is_repeat(self, code: str) -> bool:
+        """
+        True when the model produced code that has already been run for this request.
+        """
+        code_hash = self.code_hash(code)
+        return any(attempt.code_hash == code_hash for attempt in self.attempts)
+
+    def record(
+        self,
+        code: str,
+        exit_code: int,
+        generation_seconds: float,
+        execution_seconds: float,
+        usage: Optional[RequestUsage],
+        same_round: bool = False,
+    ) -> AttemptRecord:
+        """
+        Records one executed script. `same_round` adds another candidate to the latest round, so a
+        race uses one of the policy's attempts however many candidates finished.
+        """
+        attempt = AttemptRecord(
+            attempt=len(self.attempts) + 1,
+            code_hash=self.code_hash(code),
+            exit_code=exit_code,
+            generation_seconds=generation_seconds,
+            execution_seconds=execution_seconds,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+            cached=usage is None,
+            round=self.rounds if same_round and self.attempts else self.rounds + 1,
+        )
+        self.attempts.append(attempt)
+        return attempt
+
+    @property
+    def rounds(self) -> int:
+        return self.attempts[-1].round if self.attempts else 0
+
+    def can_retry(self) -> bool:
+        return (
+            self.rounds < self.policy.max_attempts
+            and time.monotonic() - self.started < self.policy.time_budget
+        )
+
+    def feedback(self, exit_code: int, output: str) -> str:
+        """
+        Repair prompt carrying the tail of the failed run's output, where the traceback lives.
+        """
+        tail = output[-self.policy.feedback_chars :]
+        return f"Error: the code exited with code {exit_code}. Output:\n{tail}\nFix the code and return the complete script."
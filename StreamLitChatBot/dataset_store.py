@@ -0,0 +1,150 @@
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+READERS = {".csv": "csv", ".tsv": "tsv", ".xlsx": "excel", ".xls": "excel", ".parquet": "parquet"}
+SAMPLE_ROWS = 5
+MAX_SUMMARY_COLUMNS = 40
+MAX_SAMPLE_CHARS = 1500
+
+
+@dataclass
+class Dataset:
+    """
+    An uploaded table converted to Parquet in the shared cache. `name` is the file name the
+    generated code sees in its working directory; `hash` is the digest of the uploaded bytes.
+    """
+
+    hash: str
+    name: str
+    path: str
+    rows: int
+    columns: List[Tuple[str, str]] = field(default_factory=list)
+    sample: str = ""
+
+    def summary(self) -> str:
+        """
+        Compact description for the code-generation prompt: schema and a few sample rows, never the data itself.
+        """
+        shown = ", ".join(f"{column} ({dtype})" for column, dtype in self.columns[:MAX_SUMMARY_COLUMNS])
+        if len(self.columns) > MAX_SUMMARY_COLUMNS:
+            shown += f", ... ({len(self.columns) - MAX_SUMMARY_COLUMNS} more)"
+        return (
+            f"File `{self.name}` ({self.rows:,} rows, {len(self.columns)} columns; load it with "
+            f"pd.read_parquet('{self.name}', memory_map=True)). Columns: {shown}.\n"
+            f"First rows:\n{self.sample}"
+        )
+
+
+def _read_table(suffix: str, data: bytes):
+    import pandas as pd
+
+    kind = READERS.get(suffix)
+    if kind is None:
+        raise ValueError(f"Unsupported file type {suffix!r}; upload one of {', '.join(READERS)}")
+    buffer = io.BytesIO(data)
+    if kind == "csv":
+        return pd.read_csv(buffer)
+    if kind == "tsv":
+        return pd.read_csv(buffer, sep="\t")
+    if kind == "excel":
+        return pd.read_excel(buffer)
+    return pd.read_parquet(buffer)
+
+
+class DatasetStore:
+    """
+    Content-addressed cache of uploaded tables, shared by all sessions.
+
+    Each distinct upload is parsed once and stored read-only as `<hash>.parquet` next to a JSON
+    summary, so re-uploads and reruns cost a hash and a small read. Request directories get a
+    symlink to the cached file instead of a copy, and the store remembers which datasets each
+    session has attached.
+    """
+
+    def __init__(self, root: Path = Path("cloudserve_cache") / "datasets"):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._sessions: Dict[str, List[Dataset]] = {}
+        self._lock = threading.Lock()
+
+    def ingest(self, filename: str, data: bytes) -> Dataset:
+        """
+        Converts an upload to Parquet unless identical bytes were ingested before. Raises
+        ValueError for unreadable files and ImportError when the parser (pyarrow, openpyxl) is missing.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        stem = re.sub(r"[^A-Za-z0-9_.-]+", "_", Path(filename).stem).strip("._") or "data"
+        meta_path = self.root / f"{digest}.json"
+        try:
+            dataset = Dataset(**json.loads(meta_path.read_text()))
+            dataset.columns = [tuple(column) for column in dataset.columns]
+            dataset.name = f"{stem}.parquet"  # Same bytes under another name
+            return dataset
+        except (OSError, ValueError, TypeError):
+            pass
+
+        frame = _read_table(Path(filename).suffix.lower(), data)
+        frame.columns = [str(column) for column in frame.columns]  # Parquet needs string column names
+        path = self.root / f"{digest}.parquet"
+        staging = self.root / f".tmp-{uuid.uuid4().hex}.parquet"
+        frame.to_parquet(staging, index=False)
+        os.chmod(staging, 0o444)
+        os.replace(staging, path)
+
+        sample = frame.head(SAMPLE_ROWS).to_csv(index=False)
+        dataset = Dataset(
+            hash=digest,
+            name=f"{stem}.parquet",
+            path=str(path.resolve()),
+            rows=len(frame),
+            columns=[(column, str(dtype)) for column, dtype in frame.dtypes.items()],
+            sample=sample[:MAX_SAMPLE_CHARS],
+        )
+        meta_path.write_text(json.dumps(asdict(dataset)))
+        return dataset
+
+    def set_datasets(self, session_id: str, datasets: Iterable[Dataset]) -> None:
+        """
+        Replaces the datasets attached to `session_id`; later uploads win on a name clash.
+        """
+        by_name = {dataset.name: dataset for dataset in datasets}
+        with self._lock:
+            self._sessions[session_id] = list(by_name.values())
+
+    def datasets(self, session_id: str) -> List[Dataset]:
+        with self._lock:
+            return list(self._sessions.get(session_id, []))
+
+    @staticmethod
+    def link_into(datasets: Iterable[Dataset], directory: Path) -> None:
+        """
+        Symlinks each dataset into `directory` under its `name`; the cached files are read-only.
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        for dataset in datasets:
+            link = directory / dataset.name
+            if not link.is_symlink():
+                link.symlink_to(dataset.path)
+
+
+_store: Optional[DatasetStore] = None
+_store_lock = threading.Lock()
+
+
+def get_dataset_store() -> DatasetStore:
+    """
+    Returns the process-wide dataset store.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DatasetStore()
+        return _store
@@ -0,0 +1,122 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import queue
+import threading
+import weakref
+from typing import Any, AsyncIterable, Awaitable, Generic, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class StreamHandle(Generic[T]):
+    """
+    Blocking iterator over items produced by an async stream running on the background loop.
+    """
+
+    def __init__(
+        self,
+        items: "queue.Queue",
+        future: concurrent.futures.Future,
+        loop: asyncio.AbstractEventLoop,
+        cancellation_token: Optional[Any] = None,
+    ):
+        self._items = items
+        self.future = future
+        self._loop = loop
+        self._cancellation_token = cancellation_token
+
+    def __iter__(self) -> Iterator[T]:
+        while True:
+            item = self._items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+
+    def cancel(self) -> None:
+        """
+        Stops consuming the stream; a no-op once it has finished. Call it when the reader gives up,
+        e.g. when Streamlit interrupts the script, so the stream does not keep running unread.
+
+        The stream's cancellation token, if any, is cancelled on the loop as well: cancelling the
+        consumer alone leaves work the stream started (agent replies, model calls) running to the end.
+        """
+        if self._cancellation_token is not None and not self.future.done():
+            self._loop.call_soon_threadsafe(self._cancellation_token.cancel)
+        self.future.cancel()
+
+
+class BackgroundLoop:
+    """
+    A long-lived asyncio event loop running in a daemon thread.
+
+    Every team turn of the Streamlit app runs here, so model client connection pools and
+    executor state stay bound to one loop, and turns from different sessions overlap their I/O
+    instead of each blocking its own script thread inside `asyncio.run`.
+    """
+
+    def __init__(self, name: str = "autogen-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._locks: "weakref.WeakKeyDictionary[object, asyncio.Lock]" = weakref.WeakKeyDictionary()  # Only touched on the loop
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro: Awaitable[T]) -> "concurrent.futures.Future[T]":
+        """
+        Schedules `coro` on the background loop and returns a thread-safe future for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stream(
+        self, stream: AsyncIterable[T], exclusive: Optional[object] = None, cancellation_token: Optional[Any] = None
+    ) -> StreamHandle[T]:
+        """
+        Consumes `stream` on the background loop and hands its items over through a queue.
+
+        Streams sharing an `exclusive` key run one at a time: a stream only starts after the
+        previous one, including one that was cancelled, has finished cleaning up. Pass the
+        `CancellationToken` the stream was created with so `StreamHandle.cancel` stops it too.
+        """
+        items: "queue.Queue" = queue.Queue()
+
+        async def pump() -> None:
+            try:
+                lock = self._locks.setdefault(exclusive, asyncio.Lock()) if exclusive is not None else contextlib.nullcontext()
+                async with lock:
+                    async for item in stream:
+                        items.put(item)
+            except BaseException as e:
+                items.put(_Failure(e))
+                raise
+            finally:
+                items.put(_DONE)
+
+        return StreamHandle(items, self.submit(pump()), self.loop, cancellation_token)
+
+
+_background_loop: Optional[BackgroundLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> BackgroundLoop:
+    """
+    Returns the process-wide background loop, starting it on first use.
+    """
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            _background_loop = BackgroundLoop()
+        return _background_loop
@@ -0,0 +1,64 @@
+import json
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the standard library encoder is used without it
+    orjson = None
+
+RESULT_TYPE = "cloudserve_result"
+
+
+def _dumps(data: Dict[str, Any]) -> str:
+    if orjson is not None:
+        return orjson.dumps(data).decode()
+    return json.dumps(data)
+
+
+def _loads(content: str) -> Any:
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+@dataclass
+class ExecutionResult:
+    """
+    Result of one CloudServeAgent request, sent to the team as a JSON TextMessage.
+    """
+
+    uuid: str
+    image_urls: List[str] = field(default_factory=list)
+    code: str = ""
+    exit_code: int = 0
+    stdout: str = ""  # Head and tail of the output; the full text is in `stdout_path`
+    stdout_bytes: int = 0
+    stdout_path: str = ""
+    error_message: str = ""
+    other_files: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def to_json(self) -> str:
+        return _dumps({"type": RESULT_TYPE, **self.to_dict()})
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ExecutionResult":
+        return cls(**{key: value for key, value in data.items() if key in cls.__dataclass_fields__})
+
+    @classmethod
+    def from_json(cls, content: str) -> Optional["ExecutionResult"]:
+        """
+        Decodes a message produced by `to_json`; returns None for any other content.
+        """
+        if not content.startswith("{"):
+            return None
+        try:
+            data = _loads(content)
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or data.get("type") != RESULT_TYPE:
+            return None
+        return cls.from_dict(data)
@@ -0,0 +1,169 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+
+from telemetry import metrics
+from warm_executor import DEFAULT_WORKERS
+
+EX_TEMPFAIL = 75  # Exit code reported for jobs rejected under load
+
+
+class ExecutionRejected(RuntimeError):
+    """
+    Raised when the execution queue is full; the caller should report "busy" rather than wait.
+    """
+
+
+class ExecutionTicket:
+    """
+    A place in the `ExecutionScheduler` queue. Use it as an async context manager: entering
+    waits for a slot, leaving frees it. `position` is the number of jobs queued ahead of it.
+    """
+
+    def __init__(self, scheduler: "ExecutionScheduler", session_id: str):
+        self._scheduler = scheduler
+        self.session_id = session_id
+        self.created = time.monotonic()
+        self._granted = threading.Event()
+        self._waiter: Optional[asyncio.Future] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._granted.is_set()
+
+    @property
+    def position(self) -> int:
+        return self._scheduler.position(self)
+
+    def _grant(self) -> None:
+        self._granted.set()
+        if self._waiter is not None:
+            self._loop.call_soon_threadsafe(lambda: self._waiter.done() or self._waiter.set_result(None))
+
+    async def __aenter__(self) -> "ExecutionTicket":
+        if not self._granted.is_set():
+            self._loop = asyncio.get_running_loop()
+            self._waiter = self._loop.create_future()
+            if self._granted.is_set():  # Granted between the check and creating the future
+                self._waiter.set_result(None)
+            try:
+                await self._waiter
+            except asyncio.CancelledError:
+                self._scheduler.cancel(self)
+                raise
+        metrics.observe("execution_queue", time.monotonic() - self.created)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._scheduler.release(self)
+
+
+class ExecutionScheduler:
+    """
+    Bounds how many generated scripts run at once across all sessions.
+
+    Jobs beyond `slots` wait in per-session queues that are served round-robin, so one session
+    submitting many jobs cannot starve the others. `session_limit` optionally caps the slots a
+    single session holds at once. When `max_queue` jobs are already waiting, `enqueue` raises
+    `ExecutionRejected` instead of letting latency grow without bound.
+    """
+
+    def __init__(self, slots: int, *, max_queue: int = 32, session_limit: Optional[int] = None):
+        self.slots = slots
+        self._max_queue = max_queue
+        self._session_limit = session_limit
+        self._lock = threading.Lock()
+        self._running: Dict[str, int] = {}
+        self._queues: "OrderedDict[str, Deque[ExecutionTicket]]" = OrderedDict()  # Order is the round-robin rotation
+        self._queued = 0
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def free_slots(self) -> int:
+        with self._lock:
+            return max(self.slots - sum(self._running.values()), 0)
+
+    def enqueue(self, session_id: str) -> ExecutionTicket:
+        ticket = ExecutionTicket(self, session_id)
+        with self._lock:
+            if self._queued >= self._max_queue:
+                metrics.inc("cloudserve_execution_rejected_total")
+                raise ExecutionRejected(f"{self._queued} executions are already waiting")
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            self._queued += 1
+            self._dispatch()
+        return ticket
+
+    def position(self, ticket: ExecutionTicket) -> int:
+        with self._lock:
+            if ticket.ready:
+                return 0
+            # Round-robin order: everything queued before it in its session, plus up to as many from each other session
+            queue = self._queues.get(ticket.session_id, deque())
+            own = queue.index(ticket) if ticket in queue else 0
+            return own + sum(min(len(other), own + 1) for session, other in self._queues.items() if session != ticket.session_id)
+
+    def release(self, ticket: ExecutionTicket) -> None:
+        with self._lock:
+            self._running[ticket.session_id] -= 1
+            if not self._running[ticket.session_id]:
+                del self._running[ticket.session_id]
+            self._dispatch()
+
+    def cancel(self, ticket: ExecutionTicket) -> None:
+        with self._lock:
+            queue = self._queues.get(ticket.session_id)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                self._queued -= 1
+                if not queue:
+                    del self._queues[ticket.session_id]
+                self._publish()
+                return
+        if ticket.ready:
+            self.release(ticket)  # Granted just as the waiter was cancelled
+
+    def _dispatch(self) -> None:
+        """
+        Grants free slots to the head of each eligible session queue in rotation. Caller holds the lock.
+        """
+        while sum(self._running.values()) < self.slots:
+            session_id = next(
+                (session for session in self._queues if self._session_limit is None or self._running.get(session, 0) < self._session_limit),
+                None,
+            )
+            if session_id is None:
+                break
+            queue = self._queues.pop(session_id)
+            ticket = queue.popleft()
+            if queue:
+                self._queues[session_id] = queue  # Back of the rotation
+            self._queued -= 1
+            self._running[session_id] = self._running.get(session_id, 0) + 1
+            ticket._grant()
+        self._publish()
+
+    def _publish(self) -> None:
+        metrics.set("cloudserve_execution_queue_depth", self._queued)
+        metrics.set("cloudserve_execution_running", sum(self._running.values()))
+
+
+_scheduler: Optional[ExecutionScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_execution_scheduler() -> ExecutionScheduler:
+    """
+    Returns the process-wide scheduler, with one slot per warm worker.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ExecutionScheduler(DEFAULT_WORKERS)
+        return _scheduler
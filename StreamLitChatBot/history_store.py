@@ -0,0 +1,142 @@
+import functools
+import json
+import os
+import shutil
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from execution_result import ExecutionResult
+
+
+@dataclass
+class HistoryEntry:
+    """
+    Compact chat history item: plain text inline, CloudServeAgent results by reference to a JSON file.
+    """
+
+    id: int
+    role: str
+    text: str = ""
+    result_path: str = ""
+
+
+@functools.lru_cache(maxsize=256)
+def load_result(path: str) -> ExecutionResult:
+    """
+    Reads a stored result; results never change once written, so they are memoized by path.
+    """
+    return ExecutionResult.from_json(Path(path).read_text())
+
+
+def _tail_lines(path: Path, count: int, block_size: int = 64 * 1024) -> List[bytes]:
+    """
+    Last `count` lines of `path`, read backwards in blocks so the cost does not grow with the file.
+    """
+    with open(path, "rb") as file:
+        end = file.seek(0, os.SEEK_END)
+        data = b""
+        while end > 0 and data.count(b"\n") <= count:  # One extra newline: the first block may start mid-line
+            start = max(end - block_size, 0)
+            file.seek(start)
+            data = file.read(end - start) + data
+            end = start
+    return data.splitlines()[-count:]
+
+
+def collect_histories(root: Path, max_age: float) -> int:
+    """
+    Removes the session histories under `root` that were not written to for `max_age` seconds.
+    Meant as a `WorkspaceManager` collector; returns how many were removed.
+    """
+    if not root.is_dir():
+        return 0
+    removed = 0
+    for session in root.iterdir():
+        if session.is_dir() and time.time() - session.stat().st_mtime > max_age:
+            shutil.rmtree(session, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+class ChatHistory:
+    """
+    Per-session chat history with windowed rendering.
+
+    Only the newest `max_in_memory` entries are kept in memory; older ones are spilled to a
+    JSONL file under `directory` and read back only when the user pages that far. `visible()`
+    returns the newest `window` entries, and `load_older()` grows the window by `page_size`.
+    Every write touches `directory`, whose age `collect_histories` uses to find abandoned sessions.
+    """
+
+    def __init__(self, directory: Path, *, page_size: int = 20, max_in_memory: int = 200):
+        self._directory = directory
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._spill_path = directory / "history.jsonl"
+        self._page_size = page_size
+        self._max_in_memory = max_in_memory
+        self._entries: List[HistoryEntry] = []
+        self._spilled = 0
+        self._spilled_page: Tuple[int, int, List[HistoryEntry]] = (0, 0, [])  # (spilled, count, entries) of the last read
+        self.window = page_size
+
+    def __len__(self) -> int:
+        return self._spilled + len(self._entries)
+
+    def append_text(self, role: str, text: str) -> HistoryEntry:
+        return self._append(HistoryEntry(id=len(self), role=role, text=text))
+
+    def append_result(self, role: str, result: ExecutionResult) -> HistoryEntry:
+        path = self._directory / "results" / f"{result.uuid}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)  # Also recreates a directory collected while idle
+        path.write_text(result.to_json())
+        return self._append(HistoryEntry(id=len(self), role=role, text=f"Result {result.uuid}", result_path=str(path)))
+
+    def _append(self, entry: HistoryEntry) -> HistoryEntry:
+        self._entries.append(entry)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        os.utime(self._directory)  # Marks the session as active for collect_histories
+        if len(self._entries) > self._max_in_memory:
+            keep = self._max_in_memory // 2
+            with open(self._spill_path, "a") as spill:
+                for old in self._entries[:-keep]:
+                    spill.write(json.dumps(asdict(old)) + "\n")
+            self._spilled += len(self._entries) - keep
+            self._entries = self._entries[-keep:]
+        return entry
+
+    def has_older(self) -> bool:
+        return len(self) > self.window
+
+    def load_older(self) -> None:
+        self.window += self._page_size
+
+    def visible(self) -> List[HistoryEntry]:
+        if self.window <= len(self._entries):
+            return self._entries[-self.window :]
+        needed = min(self.window - len(self._entries), self._spilled)
+        return self._read_spilled(needed) + self._entries
+
+    def _read_spilled(self, count: int) -> List[HistoryEntry]:
+        if count <= 0:
+            return []
+        spilled, cached_count, entries = self._spilled_page
+        if (spilled, cached_count) != (self._spilled, count):  # Reruns with the same window reuse the last read
+            try:
+                entries = [HistoryEntry(**json.loads(line)) for line in _tail_lines(self._spill_path, count)]
+            except OSError:
+                entries = []  # Collected while the session was idle
+            self._spilled_page = (self._spilled, count, entries)
+        return entries
+
+    def result(self, entry: HistoryEntry) -> Optional[ExecutionResult]:
+        """
+        The stored result for `entry`, or None for text entries and results whose file is gone.
+        """
+        if not entry.result_path:
+            return None
+        try:
+            return load_result(entry.result_path)
+        except (OSError, ValueError):
+            return None
@@ -0,0 +1,37 @@
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from autogen_core.code_executor import CodeResult
+
+Snapshot = Dict[str, Tuple[int, int]]
+
+
+@dataclass
+class ManifestCodeResult(CodeResult):
+    """
+    Code result that also lists the files the run created or modified, relative to its working directory.
+    """
+
+    files: List[str] = field(default_factory=list)
+
+
+def snapshot(directory: Path) -> Snapshot:
+    """
+    (mtime_ns, size) of every regular file directly inside `directory`; symlinked inputs are skipped.
+    """
+    entries: Snapshot = {}
+    try:
+        with os.scandir(directory) as scan:
+            for entry in scan:
+                if entry.is_file(follow_symlinks=False):
+                    stat = entry.stat()
+                    entries[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def changed_files(before: Snapshot, after: Snapshot) -> List[str]:
+    return sorted(name for name, state in after.items() if before.get(name) != state)
@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, AsyncGenerator, Dict, Mapping, Optional, Sequence, Union
+
+import openai
+from autogen_core import CancellationToken
+from autogen_core.models import CreateResult, LLMMessage
+from autogen_core.tools import Tool, ToolSchema
+from autogen_ext.models.openai import OpenAIChatCompletionClient
+
+from response_cache import normalize_messages
+from telemetry import metrics
+
+DEFAULT_MODEL = "gpt-4o-mini"
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError, openai.APITimeoutError)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at `per_minute`. `reserve` takes the tokens immediately,
+    possibly going into debt, and returns how long the caller must wait before using them.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self._rate = per_minute / 60
+        self._tokens = per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            self._tokens -= min(amount, self.capacity)
+            return max(-self._tokens / self._rate, 0.0)
+
+
+def _shared_http_client():
+    """
+    HTTP/2 client for AsyncOpenAI when the `h2` package is installed; otherwise None and the
+    shared AsyncOpenAI keeps its default HTTP/1.1 keep-alive pool.
+    """
+    try:
+        import h2  # noqa: F401
+        from openai import DefaultAsyncHttpxClient
+    except ImportError:
+        return None
+    return DefaultAsyncHttpxClient(http2=True)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"]) if response is not None else None
+    except (KeyError, ValueError):
+        return None
+
+
+class PooledChatCompletionClient(OpenAIChatCompletionClient):
+    """
+    OpenAI client meant to be shared by every agent and session of the process.
+
+    On top of the shared connection pool it adds:
+    - coalescing: identical `create` calls already in flight share one request. Arguments are
+      part of the identity, so callers that want independent samples of one prompt pass
+      distinct `extra_create_args`, e.g. a `seed` each;
+    - client-side rate limiting with request and token buckets sized to the API quota;
+    - retries on 429, 5xx and connection errors with full-jitter exponential backoff,
+      honoring Retry-After. The SDK's own retries are turned off so they do not stack.
+    Streams are rate limited and retried only until their first chunk arrives.
+    """
+
+    def __init__(
+        self,
+        *,
+        requests_per_minute: float = 500,
+        tokens_per_minute: float = 200_000,
+        retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 20,
+        **kwargs: Any,
+    ):
+        kwargs["max_retries"] = 0
+        http_client = _shared_http_client()
+        if http_client is not None:
+            kwargs.setdefault("http_client", http_client)
+        super().__init__(**kwargs)
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._retries = retries
+        self._backoff_base = backoff_base
+        self._backoff_cap = backoff_cap
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def _throttle(self, messages: Sequence[LLMMessage]) -> None:
+        estimated_tokens = len(normalize_messages(messages)) / 4  # Rough, but no tokenizer on the hot path
+        wait = max(self._requests.reserve(1), self._tokens.reserve(estimated_tokens))
+        if wait > 0:
+            metrics.observe("model_rate_limit_wait", wait)
+            await asyncio.sleep(wait)
+
+    async def _backoff(self, attempt: int, error: Exception) -> None:
+        delay = _retry_after(error) or random.uniform(0, min(self._backoff_cap, self._backoff_base * 2**attempt))
+        metrics.inc("cloudserve_model_retries_total", error=type(error).__name__)
+        await asyncio.sleep(delay)
+
+    async def _create_with_retries(self, messages: Sequence[LLMMessage], **kwargs: Any) -> CreateResult:
+        for attempt in range(self._retries + 1):
+            await self._throttle(messages)
+            try:
+                return await super().create(messages, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self._retries:
+                    raise
+                await self._backoff(attempt, e)
+        raise AssertionError("unreachable")
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        key = hashlib.sha256(
+            json.dumps([normalize_messages(messages), [str(tool) for tool in tools], json_output, dict(extra_create_args)], default=str).encode()
+        ).hexdigest()
+        shared = self._inflight.get(key)
+        if shared is None or shared.get_loop() is not asyncio.get_running_loop():
+            # The request runs as its own task so one caller's cancellation does not fail the others
+            shared = asyncio.ensure_future(
+                self._create_with_retries(messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args)
+            )
+            self._inflight[key] = shared
+            shared.add_done_callback(lambda done: self._inflight.pop(key, None) if self._inflight.get(key) is done else None)
+        else:
+            metrics.inc("cloudserve_model_coalesced_total")
+        waiter = asyncio.shield(shared)
+        if cancellation_token is not None:
+            cancellation_token.link_future(waiter)
+        return await waiter
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        for attempt in range(self._retries + 1):
+            await self._throttle(messages)
+            started = False
+            try:
+                async for chunk in super().create_stream(
+                    messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args, cancellation_token=cancellation_token
+                ):
+                    started = True
+                    yield chunk
+                return
+            except RETRYABLE_ERRORS as e:
+                if started or attempt == self._retries:
+                    raise
+                await self._backoff(attempt, e)
+
+
+_clients: Dict[str, PooledChatCompletionClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_model_client(model: str = DEFAULT_MODEL) -> PooledChatCompletionClient:
+    """
+    Returns the process-wide pooled client for `model`. The rate limits come from
+    OPENAI_RPM and OPENAI_TPM when set, so they can match the account's quota.
+    """
+    with _clients_lock:
+        if model not in _clients:
+            _clients[model] = PooledChatCompletionClient(
+                model=model,
+                requests_per_minute=float(os.environ.get("OPENAI_RPM", 500)),
+                tokens_per_minute=float(os.environ.get("OPENAI_TPM", 200_000)),
+            )
+        return _clients[model]
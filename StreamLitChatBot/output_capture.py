@@ -0,0 +1,61 @@
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+OUTPUT_FILENAME = "output.log"
+DEFAULT_HEAD_BYTES = 4096
+DEFAULT_TAIL_BYTES = 4096
+
+
+@dataclass
+class CapturedOutput:
+    """
+    Bounded view of a run's output: the first and last bytes plus a reference to the full spool file.
+    """
+
+    head: str
+    tail: str
+    total_bytes: int
+    path: str
+
+    @property
+    def truncated(self) -> bool:
+        return bool(self.tail)
+
+    def preview(self) -> str:
+        if not self.truncated:
+            return self.head
+        omitted = self.total_bytes - len(self.head.encode()) - len(self.tail.encode())
+        return f"{self.head}\n... [{omitted} bytes omitted] ...\n{self.tail}"
+
+    def read_full(self) -> str:
+        return read_output(self.path)
+
+
+def read_output(path: str) -> str:
+    """
+    Reads a whole spool file; only called when the user asks for the full output.
+    """
+    return Path(path).read_text(errors="replace")
+
+
+def capture_file(path: Path, head_bytes: int = DEFAULT_HEAD_BYTES, tail_bytes: int = DEFAULT_TAIL_BYTES) -> CapturedOutput:
+    """
+    Reads only the head and tail of the spool file at `path`.
+    """
+    total = path.stat().st_size
+    with open(path, "rb") as spool:
+        if total <= head_bytes + tail_bytes:
+            return CapturedOutput(spool.read().decode(errors="replace"), "", total, str(path))
+        head = spool.read(head_bytes)
+        spool.seek(total - tail_bytes, os.SEEK_SET)
+        tail = spool.read(tail_bytes)
+    return CapturedOutput(head.decode(errors="replace"), tail.decode(errors="replace"), total, str(path))
+
+
+def spool_text(text: str, path: Path, head_bytes: int = DEFAULT_HEAD_BYTES, tail_bytes: int = DEFAULT_TAIL_BYTES) -> CapturedOutput:
+    """
+    Writes output that is already in memory to a spool file, for executors that do not stream to disk.
+    """
+    path.write_text(text, errors="replace")
+    return capture_file(path, head_bytes, tail_bytes)
@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from autogen_core.models import LLMMessage
+
+from telemetry import metrics
+
+Embedder = Callable[[str], Awaitable[Sequence[float]]]
+
+
+@dataclass
+class CacheLookup:
+    """
+    Outcome of `ResponseCache.lookup`; pass it back to `store` on a miss.
+    """
+
+    key: str
+    prompt: str
+    content: Optional[str] = None
+    embedding: Optional[List[float]] = None
+    hit_key: Optional[str] = None  # Key of the entry that served `content`
+
+
+def normalize_messages(messages: Sequence[LLMMessage]) -> str:
+    """
+    Flattens (system prompt, messages) into a whitespace-normalized string used as cache key material.
+    """
+    parts = []
+    for msg in messages:
+        content = msg.content if isinstance(msg.content, str) else json.dumps(msg.content, default=str)
+        parts.append(f"{type(msg).__name__}:{' '.join(content.split())}")
+    return "\n".join(parts)
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def openai_embedder(model: str = "text-embedding-3-small") -> Embedder:
+    """
+    Embedding function for the similarity tier backed by the OpenAI embeddings API.
+    """
+    from openai import AsyncOpenAI
+
+    client = AsyncOpenAI()
+
+    async def embed(text: str) -> Sequence[float]:
+        response = await client.embeddings.create(model=model, input=text)
+        return response.data[0].embedding
+
+    return embed
+
+
+class ResponseCache:
+    """
+    On-disk cache of model completions keyed by the normalized prompt.
+
+    Lookups first try an exact match on the prompt hash. When an `embed` function is given,
+    a miss falls back to the most similar cached prompt whose cosine similarity reaches
+    `similarity_threshold`. Entries expire after `ttl` seconds and the least recently used
+    ones are evicted beyond `max_entries`. Callers store a completion only once its code has
+    run successfully, and `discard` a served one whose code failed. Lookup outcomes are counted
+    in `stats` and exported as `cloudserve_response_cache_total{outcome}`.
+    """
+
+    def __init__(
+        self,
+        path: Path = Path("cloudserve_cache") / "responses.sqlite",
+        *,
+        ttl: float = 7 * 24 * 3600,
+        max_entries: int = 2000,
+        embed: Optional[Embedder] = None,
+        similarity_threshold: float = 0.95,
+    ):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                prompt TEXT NOT NULL,
+                embedding TEXT,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._embed = embed
+        self._similarity_threshold = similarity_threshold
+        self.stats: Dict[str, int] = {"hits": 0, "similar_hits": 0, "misses": 0}
+
+    async def lookup(self, messages: Sequence[LLMMessage]) -> CacheLookup:
+        prompt = normalize_messages(messages)
+        lookup = CacheLookup(key=hashlib.sha256(prompt.encode()).hexdigest(), prompt=prompt)
+        lookup.content = await asyncio.to_thread(self._get_exact, lookup.key)
+        if lookup.content is not None:
+            lookup.hit_key = lookup.key
+            self._count("hits")
+            return lookup
+
+        if self._embed is not None:
+            lookup.embedding = list(await self._embed(prompt))
+            lookup.hit_key, lookup.content = await asyncio.to_thread(self._get_similar, lookup.embedding)
+            if lookup.content is not None:
+                self._count("similar_hits")
+                return lookup
+
+        self._count("misses")
+        return lookup
+
+    def _count(self, outcome: str) -> None:
+        self.stats[outcome] += 1
+        metrics.inc("cloudserve_response_cache_total", outcome=outcome)
+
+    async def store(self, lookup: CacheLookup, content: str) -> None:
+        await asyncio.to_thread(self._put, lookup, content)
+
+    async def discard(self, lookup: CacheLookup) -> None:
+        """
+        Drops the entry that served `lookup`, e.g. because its code no longer runs.
+        """
+        if lookup.hit_key is not None:
+            await asyncio.to_thread(self._delete, lookup.hit_key)
+
+    def _get_exact(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content FROM responses WHERE key = ? AND created_at >= ?", (key, time.time() - self._ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            self._touch(key)
+            return row[0]
+
+    def _get_similar(self, embedding: List[float]) -> Tuple[Optional[str], Optional[str]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, embedding, content FROM responses WHERE embedding IS NOT NULL AND created_at >= ?",
+                (time.time() - self._ttl,),
+            ).fetchall()
+            best_key, best_content, best_score = None, None, self._similarity_threshold
+            for key, stored, content in rows:
+                score = _cosine(embedding, json.loads(stored))
+                if score >= best_score:
+                    best_key, best_content, best_score = key, content, score
+            if best_key is not None:
+                self._touch(best_key)
+            return best_key, best_content
+
+    def _put(self, lookup: CacheLookup, content: str) -> None:
+        now = time.time()
+        embedding = json.dumps(lookup.embedding) if lookup.embedding is not None else None
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (lookup.key, lookup.prompt, embedding, content, now, now),
+            )
+            self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self._ttl,))
+            self._db.execute(
+                "DELETE FROM responses WHERE key NOT IN "
+                "(SELECT key FROM responses ORDER BY last_access DESC LIMIT ?)",
+                (self._max_entries,),
+            )
+            self._db.commit()
+
+    def _delete(self, key: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+
+    def _touch(self, key: str) -> None:
+        self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Returns the process-wide response cache, so every session shares one SQLite connection and its lock.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
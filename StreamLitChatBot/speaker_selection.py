@@ -0,0 +1,46 @@
+from typing import Mapping, Optional, Sequence
+
+from autogen_agentchat.messages import AgentEvent, ChatMessage
+from telemetry import metrics, span
+
+
+class RuleBasedSpeakerSelector:
+    """
+    `selector_func` for `SelectorGroupChat` that picks the next speaker from fixed transitions.
+
+    The next speaker is looked up from the source of the last message, so the forced
+    PlanningAgent -> CloudServeAgent -> PlanningAgent hand-off costs no model call. When the
+    source has no rule the selector returns None and the team falls back to the LLM selector;
+    `fallbacks` counts how often that happened, and `cloudserve_selector_total{path}` exports
+    both counts on `/metrics`.
+    """
+
+    def __init__(self, transitions: Mapping[str, str], first_speaker: str):
+        self._transitions = dict(transitions)
+        self._first_speaker = first_speaker
+        self.fast_path = 0
+        self.fallbacks = 0
+
+    def __call__(self, messages: Sequence[AgentEvent | ChatMessage]) -> Optional[str]:
+        with span("selector_rule") as current:
+            speaker = self._transitions.get(messages[-1].source) if messages else self._first_speaker
+            if speaker is None:
+                self.fallbacks += 1
+            else:
+                self.fast_path += 1
+            current.set_attribute("speaker", speaker or "")
+            metrics.inc("cloudserve_selector_total", path="llm" if speaker is None else "rule")
+        return speaker
+
+    @property
+    def fallback_rate(self) -> float:
+        total = self.fast_path + self.fallbacks
+        return self.fallbacks / total if total else 0.0
+
+
+def planner_coder_selector(planner: str = "PlanningAgent", coder: str = "CloudServeAgent") -> RuleBasedSpeakerSelector:
+    """
+    Selector for the two-agent team: the planner answers the user and every coder result,
+    and hands every plan to the coder.
+    """
+    return RuleBasedSpeakerSelector({"user": planner, planner: coder, coder: planner}, first_speaker=planner)
@@ -0,0 +1,88 @@
+"""
+Startup and rerun timing for the Streamlit app.
+
+Run `python startup.py` for a cold import-time breakdown of the app modules, measured in a
+fresh interpreter with `-X importtime`.
+"""
+import importlib
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from types import ModuleType
+from typing import Deque, Dict, List, Sequence, Tuple
+
+from telemetry import metrics
+
+APP_MODULES = ("streamlit", "streamlit_console", "history_store", "dataset_store", "AgenticModeIndependentURL")
+
+_imports: Dict[str, float] = {}
+_reruns: Deque[float] = deque(maxlen=200)
+_lock = threading.Lock()
+
+
+def timed_import(name: str) -> ModuleType:
+    """
+    Imports `name` on first use and records how long that took; later calls are a dict lookup.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    with _lock:
+        _imports[name] = time.perf_counter() - started
+    return module
+
+
+def record_rerun(seconds: float) -> None:
+    with _lock:
+        _reruns.append(seconds)
+    metrics.observe("rerun", seconds)
+
+
+def report() -> Dict[str, object]:
+    """
+    In-process timings: deferred imports and recent script reruns, in seconds.
+    """
+    with _lock:
+        reruns = sorted(_reruns)
+        imports = sorted(_imports.items(), key=lambda item: item[1], reverse=True)
+        last = _reruns[-1] if _reruns else 0.0
+    return {
+        "deferred_imports": imports,
+        "reruns": len(reruns),
+        "last_rerun": last,
+        "median_rerun": reruns[len(reruns) // 2] if reruns else 0.0,
+        "max_rerun": reruns[-1] if reruns else 0.0,
+    }
+
+
+def import_breakdown(modules: Sequence[str] = APP_MODULES, top: int = 15) -> List[Tuple[str, float]]:
+    """
+    Cold import time per top-level package, heaviest first, from `python -X importtime`.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+        cwd=Path(__file__).resolve().parent,
+        capture_output=True,
+        text=True,
+    )
+    totals: Dict[str, float] = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        own, _, name = line[len("import time:") :].split("|")
+        if not own.strip().isdigit():
+            continue  # Header line
+        # Self time summed per top-level package, so nested imports are not counted twice
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0.0) + int(own) / 1e6
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    for package, seconds in import_breakdown():
+        print(f"{seconds:8.3f}s  {package}")
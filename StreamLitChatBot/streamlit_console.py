@@ -1,157 +1,200 @@
-import asyncio
+import os
+import time
 import streamlit as st
-import json
-import ast
-from typing import AsyncGenerator, List, Optional, TypeVar, Union
-from autogen_core import Image
-from autogen_core.models import RequestUsage
-from autogen_agentchat.agents import UserProxyAgent
-from autogen_agentchat.base import Response, TaskResult
-from autogen_agentchat.messages import (
-    AgentEvent,
-    ChatMessage,
-    ModelClientStreamingChunkEvent,
-    MultiModalMessage,
-    UserInputRequestedEvent,
-)
-
-T = TypeVar("T", bound=Union[TaskResult, Response])
+from typing import TYPE_CHECKING, AsyncGenerator, Iterable, List, Optional, TypeVar, Union
+from execution_result import ExecutionResult
+from output_capture import read_output
+from artifact_cache import read_text, thumbnail_bytes
+from telemetry import span
 
-async def StreamlitConsole(
-    stream: AsyncGenerator[Union[AgentEvent, ChatMessage, T], None],
-    *,
-    output_stats: bool = False,
-    user_input_manager: Optional["UserInputManager"] = None,
-) -> T:
+if TYPE_CHECKING:
+    # autogen is imported by the renderer on the first streamed turn, so history renders never load it
+    from autogen_agentchat.base import Response, TaskResult
+    from autogen_agentchat.messages import AgentEvent, ChatMessage
+
+T = TypeVar("T", bound="Union[TaskResult, Response]")
+
+
+class _ConsoleRenderer:
     """
-    Streamlit-based console to display chatbot messages, including text and images.
+    Renders stream items one by one; shared by the async and the queue-draining consoles.
     """
-    start_time = asyncio.get_event_loop().time()
-    total_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
-    last_processed: Optional[T] = None
-    streaming_placeholder = st.empty()  # Placeholder for dynamic updates
-    chat_container = st.container()
-    streaming_chunks: List[str] = []
 
-    async for message in stream:
+    def __init__(self, output_stats: bool, user_input_manager: Optional["UserInputManager"]):
+        from autogen_core.models import RequestUsage
+
+        self.output_stats = output_stats
+        self.user_input_manager = user_input_manager
+        self.start_time = time.monotonic()
+        self.total_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self.last_processed = None
+        self.streaming_placeholder = st.empty()  # Placeholder for dynamic updates
+        self.chat_container = st.container()
+        self.streaming_chunks: List[str] = []
+
+    def handle(self, message) -> None:
+        from autogen_agentchat.messages import ModelClientStreamingChunkEvent
+
+        if isinstance(message, ModelClientStreamingChunkEvent):
+            self.streaming_chunks.append(message.content)
+            self.streaming_placeholder.write("".join(self.streaming_chunks))  # Update dynamically
+            return
+        with span("ui_render", message=type(message).__name__):
+            self._render(message)
+
+    def _count_usage(self, message: "Union[AgentEvent, ChatMessage]") -> None:
+        usage = getattr(message, "models_usage", None)
+        if self.output_stats and usage:
+            self.total_usage.completion_tokens += usage.completion_tokens
+            self.total_usage.prompt_tokens += usage.prompt_tokens
+
+    def _render(self, message) -> None:
+        from autogen_agentchat.base import Response, TaskResult
+        from autogen_agentchat.messages import UserInputRequestedEvent
+
         if isinstance(message, TaskResult):
-            duration = asyncio.get_event_loop().time() - start_time
-            if output_stats:
-                with chat_container:
+            duration = time.monotonic() - self.start_time
+            if self.output_stats:
+                with self.chat_container:
                     st.markdown(
                         f"### Summary\n"
                         f"- **Messages:** {len(message.messages)}\n"
                         f"- **Finish reason:** {message.stop_reason}\n"
-                        f"- **Prompt tokens:** {total_usage.prompt_tokens}\n"
-                        f"- **Completion tokens:** {total_usage.completion_tokens}\n"
+                        f"- **Prompt tokens:** {self.total_usage.prompt_tokens}\n"
+                        f"- **Completion tokens:** {self.total_usage.completion_tokens}\n"
                         f"- **Duration:** {duration:.2f} seconds"
                     )
-            last_processed = message  # type: ignore
+            self.last_processed = message
 
         elif isinstance(message, Response):
-            duration = asyncio.get_event_loop().time() - start_time
-            with chat_container:
+            with self.chat_container:
                 st.subheader(f"Response from {message.chat_message.source}")
                 _display_message(message.chat_message)
 
-            if output_stats and message.chat_message.models_usage:
-                total_usage.completion_tokens += message.chat_message.models_usage.completion_tokens
-                total_usage.prompt_tokens += message.chat_message.models_usage.prompt_tokens
-
-            last_processed = message  # type: ignore
-
-        elif isinstance(message, ModelClientStreamingChunkEvent):
-            streaming_chunks.append(message.content)
-            streaming_placeholder.write("".join(streaming_chunks))  # Update dynamically
+            self._count_usage(message.chat_message)
+            self.last_processed = message
 
         elif isinstance(message, UserInputRequestedEvent):
-            if user_input_manager is not None:
-                user_input_manager.notify_event_received(message.request_id)
+            if self.user_input_manager is not None:
+                self.user_input_manager.notify_event_received(message.request_id)
 
         else:
-            if streaming_chunks:
-                streaming_chunks.clear()
-                streaming_placeholder.write("")  # Clear after stream ends
+            if self.streaming_chunks:
+                self.streaming_chunks.clear()
+                self.streaming_placeholder.write("")  # Clear after stream ends
+            self._count_usage(message)
             _display_message(message)
 
-    if last_processed is None:
-        raise ValueError("No TaskResult or Response was processed.")
+    def result(self):
+        if self.last_processed is None:
+            raise ValueError("No TaskResult or Response was processed.")
+        return self.last_processed
 
-    return last_processed
+
+async def StreamlitConsole(
+    stream: AsyncGenerator["Union[AgentEvent, ChatMessage, T]", None],
+    *,
+    output_stats: bool = False,
+    user_input_manager: Optional["UserInputManager"] = None,
+) -> T:
+    """
+    Streamlit-based console to display chatbot messages, including text and images.
+    """
+    renderer = _ConsoleRenderer(output_stats, user_input_manager)
+    async for message in stream:
+        renderer.handle(message)
+    return renderer.result()
+
+
+def StreamlitConsoleSync(
+    stream: Iterable["Union[AgentEvent, ChatMessage, T]"],
+    *,
+    output_stats: bool = False,
+    user_input_manager: Optional["UserInputManager"] = None,
+) -> T:
+    """
+    Same as `StreamlitConsole`, but drains a blocking iterator such as the queue
+    returned by `BackgroundLoop.stream`, so the script thread needs no event loop.
+    """
+    renderer = _ConsoleRenderer(output_stats, user_input_manager)
+    for message in stream:
+        renderer.handle(message)
+    return renderer.result()
 
     
-def parse_json_recursively(content):
+def render_execution_result(result: ExecutionResult, expanded: bool = True) -> None:
     """
-    Recursively parses a string into a valid JSON object.
+    Renders a CloudServeAgent result. Collapsed results show a summary line until expanded,
+    and images are shown as cached thumbnails with the full-size file loaded on demand.
     """
-    if isinstance(content, dict):
-        return {key: parse_json_recursively(value) for key, value in content.items()}
-    elif isinstance(content, list):
-        return [parse_json_recursively(item) for item in content]
-    elif isinstance(content, str):
+    st.subheader(f"Directory: {result.uuid}")
+    if not expanded:
+        st.caption(f"{len(result.image_urls)} image(s), exit code {result.exit_code}")
+        if not st.toggle("Show details", key=f"details-{result.uuid}"):
+            return
+
+    missing = {path for path in [result.code, *result.image_urls] if path and not os.path.exists(path)}
+    if missing:
+        st.caption(f"{len(missing)} file(s) of this result were removed by workspace cleanup")
+
+    if result.code and result.code not in missing:
+        st.write("### Code File:")
         try:
-            return parse_json_recursively(ast.literal_eval(content))
-        except (ValueError, SyntaxError):
-            return content  # Return as is if parsing fails 
+            st.code(read_text(result.code), language="python")
+        except Exception as e:
+            st.error(f"Could not load code file: {e}")
+
+    images = [url for url in result.image_urls if url not in missing]
+    if images:
+        st.write("### Images:")
+        for url in images:
+            try:
+                image_name = url.split("/")[-1]
+                st.write(f"**Image Name:** {image_name}")
+                st.image(thumbnail_bytes(url))
+                if st.toggle("Full size", key=f"full-size-{result.uuid}-{image_name}"):
+                    st.image(url)
+            except Exception as e:
+                st.error(f"Could not load image: {e}")
+
+    if result.stdout:
+        st.write("### Output:")
+        st.code(result.stdout, language="text")
+        if result.stdout_path and result.stdout_bytes > len(result.stdout.encode()):
+            if st.button(f"Show full output ({result.stdout_bytes:,} bytes)", key=f"full-output-{result.uuid}"):
+                try:
+                    st.code(read_output(result.stdout_path), language="text")
+                except Exception as e:
+                    st.error(f"Could not load output: {e}")
+
+    if result.exit_code == 0:
+        st.success("Execution succeeded")
     else:
-        return content
+        st.error(f"Execution failed with exit code: {result.exit_code}")
 
-def _display_message(message: Union[AgentEvent, ChatMessage]) -> None:
+def render_text_message(role: str, text: str) -> None:
+    avatar = "🧑‍💻" if role == "user" else "🤖"
+    if role == "user":
+        st.markdown(f'<div class="{role}-message">{text}  {avatar}</div>', unsafe_allow_html=True)
+    else:
+        st.markdown(f'<div class="{role}-message">{avatar}  {text}</div>', unsafe_allow_html=True)
+
+def _display_message(message: "Union[AgentEvent, ChatMessage]") -> None:
     """
-    Displays messages in Streamlit, handling both plain text and JSON content.
+    Displays messages in Streamlit, handling both plain text and CloudServeAgent results.
     """
     try:
-        # st.json(message)
-        avatar = "🧑‍💻" if message.source == "user" else "🤖"
         avatarcls = "user" if message.source == "user" else "bot"
         content_str = str(message.content).strip()
-        content_data = parse_json_recursively(content_str) if content_str else None
-        bot_message = {"role": "user" if message.source == "user" else "bot", "content": content_data, "code": None, "images": []}
-        
-        if isinstance(content_data, dict):
-            if "uuid" in content_data:
-                st.subheader(f"Directory: {content_data['uuid']}")
-
-            if "code" in content_data:
-                st.write("### Code File:")
-                try:
-                    with open(content_data["code"], "r") as code_file:
-                        code_content = code_file.read()
-                    st.code(code_content, language="python")
-                    bot_message["code"] = code_content
-                except Exception as e:
-                    st.error(f"Could not load code file: {e}")
-
-            if "image_urls" in content_data and isinstance(content_data["image_urls"], list):
-                st.write("### Images:")
-                for url in content_data["image_urls"]:
-                    try:
-                        image_name = url.split("/")[-1]
-                        st.write(f"**Image Name:** {image_name}")
-                        st.image(url)
-                        bot_message["images"].append(url)  # Store images in session state
-                    except Exception as e:
-                        st.error(f"Could not load image: {e}")
-            if "result" in content_data:
-                if content_data["result"]["exit_code"] == 0:
-                    st.success("Execution succeeded")
-                else:
-                    st.error(f"Execution failed with exit code: {content_data['result']['exit_code']}")
-
-        elif isinstance(content_data, list):
-            st.write("### List Content:")
-            for idx, item in enumerate(content_data):
-                st.write(f"{idx + 1}. {item}")
+        result = ExecutionResult.from_json(content_str)
 
+        if result is not None:
+            render_execution_result(result)
+            st.session_state.history.append_result(avatarcls, result)
         else:
-            if avatarcls == "user":
-                st.markdown(f'<div class="{avatarcls}-message">{content_data}  {avatar}</div>', unsafe_allow_html=True)
-            else:
-                st.markdown(f'<div class="{avatarcls}-message">{avatar}  {content_data}</div>', unsafe_allow_html=True)
-            
-        st.session_state.messages.append(bot_message)
-
-    except (json.JSONDecodeError, TypeError, SyntaxError, ValueError) as e:
-        st.error(f"Error parsing JSON: {e}")
-        st.session_state["metadata"]["errors"]["json_parsing"] = str(e)
+            render_text_message(avatarcls, content_str)
+            st.session_state.history.append_text(avatarcls, content_str)
+
+    except (TypeError, ValueError, OSError) as e:
+        st.error(f"Error displaying message: {e}")
         st.write(message.content)
@@ -0,0 +1,81 @@
+import threading
+import time
+from typing import Callable, Dict, Generic, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class TeamRegistry(Generic[T]):
+    """
+    Keeps one agent team per Streamlit session alive between reruns.
+
+    Teams are built lazily with `factory(session_id)`. A team that has not been
+    used for `idle_timeout` seconds is evicted, and when `max_sessions` teams are
+    alive the least recently used one is dropped to make room for a new session.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], T],
+        *,
+        idle_timeout: float = 30 * 60,
+        max_sessions: int = 64,
+        on_evict: Optional[Callable[[str, T], None]] = None,
+    ):
+        self._factory = factory
+        self._idle_timeout = idle_timeout
+        self._max_sessions = max_sessions
+        self._on_evict = on_evict
+        self._teams: Dict[str, Tuple[T, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> T:
+        """
+        Returns the team for `session_id`, creating it on first use.
+        """
+        evicted = []
+        with self._lock:
+            now = time.monotonic()
+            evicted.extend(self._pop_idle(now))
+            if session_id in self._teams:
+                team, _ = self._teams[session_id]
+            else:
+                while len(self._teams) >= self._max_sessions:
+                    oldest = min(self._teams, key=lambda key: self._teams[key][1])
+                    evicted.append((oldest, self._teams.pop(oldest)[0]))
+                team = self._factory(session_id)
+            self._teams[session_id] = (team, now)
+        self._notify(evicted)
+        return team
+
+    def discard(self, session_id: str) -> None:
+        """
+        Drops the team for `session_id`, e.g. when the user resets the chat.
+        """
+        with self._lock:
+            entry = self._teams.pop(session_id, None)
+        if entry is not None:
+            self._notify([(session_id, entry[0])])
+
+    def evict_idle(self) -> int:
+        """
+        Drops every team idle for longer than the timeout and returns how many were dropped.
+        """
+        with self._lock:
+            evicted = self._pop_idle(time.monotonic())
+        self._notify(evicted)
+        return len(evicted)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._teams)
+
+    def _pop_idle(self, now: float):
+        expired = [key for key, (_, last_used) in self._teams.items() if now - last_used > self._idle_timeout]
+        return [(key, self._teams.pop(key)[0]) for key in expired]
+
+    def _notify(self, evicted) -> None:
+        if self._on_evict is None:
+            return
+        for session_id, team in evicted:
+            self._on_evict(session_id, team)
@@ -0,0 +1,211 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, Mapping, Optional, TextIO, Tuple
+
+TRACE_ENV = "CLOUDSERVE_TRACE"  # "console" or a file path; unset keeps spans in metrics only
+METRICS_PORT_ENV = "CLOUDSERVE_METRICS_PORT"
+
+
+class Metrics:
+    """
+    Minimal in-process registry rendered in the Prometheus text format.
+
+    Every finished span adds its duration to `cloudserve_stage_seconds{stage}`; its
+    `prompt_tokens`, `completion_tokens` and `retries` attributes feed the matching counters.
+    Gauges such as the execution queue depth are set directly.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._durations: Dict[str, Tuple[int, float]] = defaultdict(lambda: (0, 0.0))
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            count, total = self._durations[stage]
+            self._durations[stage] = (count + 1, total + seconds)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def set(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def render(self) -> str:
+        lines = ["# TYPE cloudserve_stage_seconds summary"]
+        with self._lock:
+            for stage, (count, total) in sorted(self._durations.items()):
+                lines.append(f'cloudserve_stage_seconds_count{{stage="{stage}"}} {count}')
+                lines.append(f'cloudserve_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            for (name, labels), value in sorted(self._counters.items()):
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+                lines.append(f"{name}{{{label_text}}} {value:g}")
+            for name, value in sorted(self._gauges.items()):
+                lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class _JsonSpan:
+    """
+    Stand-in for an OpenTelemetry span when the SDK is not installed; written as one JSON line.
+    """
+
+    def __init__(self, name: str, attributes: Dict[str, Any], parent: Optional["_JsonSpan"]):
+        self.name = name
+        self.attributes = attributes
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+
+_current_span: ContextVar[Optional[_JsonSpan]] = ContextVar("cloudserve_span", default=None)
+_tracer = None
+_sink: Optional[TextIO] = None
+_sink_lock = threading.Lock()
+_configured = False
+
+
+def configure_tracing(target: Optional[str] = None) -> None:
+    """
+    Selects where spans go: "console", a JSON-lines file path, or nowhere (None).
+
+    With `opentelemetry-sdk` installed the spans are real OpenTelemetry spans exported in
+    batches; otherwise they are written as JSON lines by this module.
+    """
+    global _tracer, _sink, _configured
+    _configured = True
+    _tracer, _sink = None, None
+    if not target:
+        return
+    out = sys.stdout if target == "console" else open(target, "a", buffering=1)
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    except ImportError:
+        _sink = out
+        return
+    provider = TracerProvider()
+    provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter(out=out, formatter=lambda s: s.to_json(indent=None) + "\n")))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer("cloudserve")
+
+
+def _record(name: str, seconds: float, attributes: Mapping[str, Any]) -> None:
+    metrics.observe(name, seconds)
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if attributes.get(kind):
+            metrics.inc("cloudserve_tokens_total", attributes[kind], stage=name, kind=kind)
+    if attributes.get("retries"):
+        metrics.inc("cloudserve_retries_total", attributes["retries"], stage=name)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """
+    Times one pipeline stage. The yielded object supports `set_attribute`; attributes set
+    on it are exported with the span and token/retry attributes are also counted in `metrics`.
+    """
+    if not _configured:
+        configure_tracing(os.environ.get(TRACE_ENV))
+    started = time.monotonic()
+    wall_started = time.time()
+    if _tracer is not None:
+        with _tracer.start_as_current_span(name, attributes=attributes) as current:
+            collected = _CollectingSpan(current, attributes)
+            try:
+                yield collected
+            finally:
+                _record(name, time.monotonic() - started, collected.attributes)
+        return
+
+    current = _JsonSpan(name, dict(attributes), _current_span.get())
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set_attribute("error", type(e).__name__)
+        raise
+    finally:
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            pass  # An abandoned async generator was closed from another context
+        seconds = time.monotonic() - started
+        _record(name, seconds, current.attributes)
+        if _sink is not None:
+            line = json.dumps(
+                {
+                    "name": name,
+                    "trace_id": current.trace_id,
+                    "span_id": current.span_id,
+                    "parent_id": current.parent_id,
+                    "start": wall_started,
+                    "duration": seconds,
+                    "attributes": current.attributes,
+                },
+                default=str,
+            )
+            with _sink_lock:
+                _sink.write(line + "\n")
+
+
+class _CollectingSpan:
+    """
+    Wraps an OpenTelemetry span and keeps a copy of its attributes for the metrics.
+    """
+
+    def __init__(self, inner: Any, attributes: Dict[str, Any]):
+        self._inner = inner
+        self.attributes = dict(attributes)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+        self._inner.set_attribute(key, value)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass  # Scrapes are not worth a log line each
+
+
+def start_metrics_server(port: Optional[int] = None, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """
+    Serves `/metrics` from a daemon thread. Returns None when the port is taken, e.g. by
+    another server process on the same host.
+    """
+    port = port if port is not None else int(os.environ.get(METRICS_PORT_ENV, "9464"))
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError:
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,59 @@
+import asyncio
+import errno
+
+import pytest
+from autogen_core import CancellationToken
+from autogen_ext.models.replay import ReplayChatCompletionClient
+
+from AgenticModeIndependentURL import CloudServeAgent
+from artifact_store import ExecutionCache
+from dataset_store import DatasetStore
+from output_capture import OUTPUT_FILENAME
+from response_cache import ResponseCache
+from warm_executor import WarmWorkerPool
+from workspace import WorkspaceManager
+
+SCRIPT = "print('ran fine')\n"
+
+
+class FullDiskCache(ExecutionCache):
+    def save(self, *args, **kwargs):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+
+class EvictedCache(ExecutionCache):
+    def restore(self, key, dest):
+        raise FileNotFoundError(errno.ENOENT, "No such file or directory", str(self.root / key / "files"))
+
+
+@pytest.fixture
+def pool():
+    pool = WarmWorkerPool(size=1, preload=(), cpu_seconds=None, memory_mb=None)
+    yield pool
+    pool.close()
+
+
+def _agent(tmp_path, pool, cache: ExecutionCache) -> CloudServeAgent:
+    return CloudServeAgent(
+        "CloudServeAgent",
+        work_dir=tmp_path / "work",
+        workspace=WorkspaceManager(tmp_path / "work"),
+        response_cache=ResponseCache(tmp_path / "responses.sqlite"),
+        execution_cache=cache,
+        worker_pool=pool,
+        model_client=ReplayChatCompletionClient([]),
+        dataset_store=DatasetStore(tmp_path / "datasets"),
+    )
+
+
+@pytest.mark.parametrize("cache_type", [FullDiskCache, EvictedCache])
+def test_cache_errors_do_not_replace_the_run(tmp_path, pool, cache_type):
+    agent = _agent(tmp_path, pool, cache_type(tmp_path / "executions"))
+    work_dir = tmp_path / "request"
+    work_dir.mkdir()
+
+    result = asyncio.run(agent._execute("python", SCRIPT, work_dir, CancellationToken()))
+
+    assert result.exit_code == 0
+    assert "ran fine" in result.output
+    assert "ran fine" in (work_dir / OUTPUT_FILENAME).read_text()
@@ -0,0 +1,73 @@
+import json
+import os
+import textwrap
+
+import pytest
+
+from warm_executor import WarmWorkerPool
+
+LEAKY_JOB = textwrap.dedent(
+    """
+    import json, os
+    import pandas as pd
+    os.environ["SECRET"] = "job-a"
+    pd.set_option("display.max_rows", 2)
+    json.dumps = lambda *args, **kwargs: "patched"
+    import helper
+    print(helper.OWNER)
+    """
+)
+
+PROBE_JOB = textwrap.dedent(
+    """
+    import json, os
+    import pandas as pd
+    import helper
+    print(os.environ.get("SECRET"), pd.get_option("display.max_rows"), json.dumps(1), helper.OWNER)
+    """
+)
+
+
+@pytest.fixture
+def pool():
+    pool = WarmWorkerPool(size=1, preload=("pandas",), cpu_seconds=None, memory_mb=None)
+    yield pool
+    pool.close()
+
+
+def test_jobs_on_one_worker_share_no_state(pool, tmp_path):
+    session_a, session_b = tmp_path / "a", tmp_path / "b"
+    for directory, owner in ((session_a, "a"), (session_b, "b")):
+        directory.mkdir()
+        (directory / "helper.py").write_text(f"OWNER = {owner!r}\n")
+
+    first = pool.run(session_a, "job_a.py", LEAKY_JOB)
+    second = pool.run(session_b, "job_b.py", PROBE_JOB)
+
+    assert first.exit_code == 0 and first.output.strip() == "a"
+    assert second.exit_code == 0
+    assert second.output.split() == ["None", "60", json.dumps(1), "b"]
+    assert "SECRET" not in os.environ
+
+
+def test_crashed_job_keeps_the_worker(pool, tmp_path):
+    crashed = pool.run(tmp_path, "crash.py", "import os\nos._exit(3)\n")
+    after = pool.run(tmp_path, "after.py", "print('ok')\n")
+
+    assert crashed.exit_code == 3 and "exited with code 3" in crashed.output
+    assert after.exit_code == 0 and after.output.strip() == "ok"
+
+
+def test_segfaulting_job_reports_its_signal(pool, tmp_path):
+    crashed = pool.run(tmp_path, "segv.py", "import os, signal\nprint('before', flush=True)\nos.kill(os.getpid(), signal.SIGSEGV)\n")
+
+    assert crashed.exit_code == 128 + 11
+    assert "before" in crashed.output and "SIGSEGV" in crashed.output
+
+
+def test_output_written_to_file_descriptors_is_captured(pool, tmp_path):
+    code = "import os, subprocess, sys\nprint('from-print')\nos.system('echo from-shell')\nsubprocess.run(['echo', 'from-subprocess'])\nos.write(2, b'from-fd2\\n')\n"
+    result = pool.run(tmp_path, "fds.py", code)
+
+    assert result.exit_code == 0
+    assert result.output.split() == ["from-print", "from-shell", "from-subprocess", "from-fd2"]
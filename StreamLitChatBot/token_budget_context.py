@@ -0,0 +1,111 @@
+import json
+from typing import Dict, List, Tuple
+
+from autogen_core.model_context import ChatCompletionContext
+from autogen_core.models import (
+    ChatCompletionClient,
+    FunctionExecutionResultMessage,
+    LLMMessage,
+    SystemMessage,
+    UserMessage,
+)
+
+SUMMARY_SOURCE = "summary"
+
+
+def _message_text(message: LLMMessage) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return json.dumps(message.content, default=str)
+
+
+class TokenBudgetedChatCompletionContext(ChatCompletionContext):
+    """
+    Chat completion context that keeps the conversation under `token_limit` tokens.
+
+    Token counts are computed once per message and cached. When a new message pushes the
+    total over the limit, everything except the `keep_recent` newest messages is folded into
+    a single running summary written by `model_client`. The summary call is only made when
+    those older messages hold at least `min_fold_tokens` new tokens and the recent ones leave
+    room for a summary; otherwise `get_messages` trims the oldest messages at read time, so a
+    few large results in the tail do not cost a model round trip on every message. If
+    summarization fails, the oldest messages are dropped instead, like a buffered context.
+    """
+
+    def __init__(
+        self,
+        model_client: ChatCompletionClient,
+        token_limit: int = 4000,
+        keep_recent: int = 4,
+        initial_messages: List[LLMMessage] | None = None,
+        min_fold_tokens: int = 1000,
+    ) -> None:
+        super().__init__(initial_messages)
+        self._model_client = model_client
+        self._token_limit = token_limit
+        self._keep_recent = keep_recent
+        self._min_fold_tokens = min_fold_tokens
+        self._token_counts: Dict[int, Tuple[LLMMessage, int]] = {}
+
+    def _tokens(self, message: LLMMessage) -> int:
+        cached = self._token_counts.get(id(message))
+        if cached is not None and cached[0] is message:
+            return cached[1]
+        try:
+            count = self._model_client.count_tokens([message])
+        except Exception:
+            count = len(_message_text(message)) // 4 + 4  # Rough estimate when the tokenizer is unavailable
+        self._token_counts[id(message)] = (message, count)
+        return count
+
+    def total_tokens(self) -> int:
+        return sum(self._tokens(message) for message in self._messages)
+
+    async def add_message(self, message: LLMMessage) -> None:
+        await super().add_message(message)
+        if self.total_tokens() > self._token_limit and self._worth_summarizing():
+            await self._summarize()
+
+    def _worth_summarizing(self) -> bool:
+        if len(self._messages) <= self._keep_recent:
+            return False
+        old, recent = self._messages[: -self._keep_recent], self._messages[-self._keep_recent :]
+        unfolded = sum(self._tokens(message) for message in old if getattr(message, "source", None) != SUMMARY_SOURCE)
+        return unfolded >= self._min_fold_tokens and sum(self._tokens(message) for message in recent) < self._token_limit
+
+    async def _summarize(self) -> None:
+        old, recent = self._messages[: -self._keep_recent], self._messages[-self._keep_recent :]
+        transcript = "\n".join(f"{getattr(message, 'source', 'system')}: {_message_text(message)}" for message in old)
+        try:
+            result = await self._model_client.create(
+                [
+                    SystemMessage(content="Summarize this conversation in a few sentences. Keep task requirements, decisions and results."),
+                    UserMessage(content=transcript, source="user"),
+                ]
+            )
+            summary = [UserMessage(content=f"Summary of the earlier conversation: {result.content}", source=SUMMARY_SOURCE)]
+        except Exception:
+            summary = []
+        for message in old:
+            self._token_counts.pop(id(message), None)
+        self._messages = summary + recent
+
+    async def get_messages(self) -> List[LLMMessage]:
+        """
+        Returns the summary and recent messages, trimming the oldest ones if they still exceed the limit.
+        """
+        messages = list(self._messages)
+        total = sum(self._tokens(message) for message in messages)
+        while len(messages) > 1 and total > self._token_limit:
+            total -= self._tokens(messages.pop(0))
+        while messages and isinstance(messages[0], FunctionExecutionResultMessage):
+            messages.pop(0)
+        return messages
+
+    async def clear(self) -> None:
+        await super().clear()
+        self._token_counts.clear()
+
+    async def load_state(self, state) -> None:
+        await super().load_state(state)
+        self._token_counts.clear()
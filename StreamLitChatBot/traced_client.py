@@ -0,0 +1,87 @@
+"""
+Model client wrapper that reports autogen's own model calls as telemetry spans.
+
+Kept apart from `telemetry` so the UI can record spans without importing autogen.
+"""
+from typing import Any, AsyncGenerator, Dict, Mapping, Optional, Sequence, Union
+
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage, ModelCapabilities, ModelInfo, RequestUsage
+from autogen_core.tools import Tool, ToolSchema
+
+from telemetry import span
+
+
+def usage_attributes(usage: Optional[RequestUsage]) -> Dict[str, int]:
+    if usage is None:
+        return {}
+    return {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+
+
+class TracedChatCompletionClient(ChatCompletionClient):
+    """
+    Delegating model client that records every call as a `stage` span with its token usage,
+    for calls made inside autogen (planner replies, LLM speaker selection) that the app does not see.
+    """
+
+    def __init__(self, inner: ChatCompletionClient, stage: str):
+        self._inner = inner
+        self._stage = stage
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        with span(self._stage, messages=len(messages)) as current:
+            result = await self._inner.create(
+                messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args, cancellation_token=cancellation_token
+            )
+            for key, value in usage_attributes(result.usage).items():
+                current.set_attribute(key, value)
+            return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        with span(self._stage, messages=len(messages), streaming=True) as current:
+            async for chunk in self._inner.create_stream(
+                messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args, cancellation_token=cancellation_token
+            ):
+                if isinstance(chunk, CreateResult):
+                    for key, value in usage_attributes(chunk.usage).items():
+                        current.set_attribute(key, value)
+                yield chunk
+
+    async def close(self) -> None:
+        await self._inner.close()
+
+    def actual_usage(self) -> RequestUsage:
+        return self._inner.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self._inner.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._inner.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._inner.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        return self._inner.capabilities
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self._inner.model_info
@@ -0,0 +1,352 @@
+import asyncio
+import contextlib
+import hashlib
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import sys
+import threading
+import traceback
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence
+
+from autogen_core import CancellationToken
+from autogen_core.code_executor import CodeBlock, CodeExecutor, CodeResult
+
+from manifest import ManifestCodeResult, changed_files, snapshot
+from output_capture import DEFAULT_HEAD_BYTES, DEFAULT_TAIL_BYTES, OUTPUT_FILENAME, capture_file
+
+PRELOAD_MODULES = ("numpy", "pandas", "matplotlib", "matplotlib.pyplot")
+PYTHON_LANGUAGES = ("python", "py", "python3")
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def _import_modules(modules: Sequence[str]) -> None:
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    for name in modules:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+
+
+def _apply_limits(cpu_seconds: Optional[int], memory_mb: Optional[int]) -> List[tuple]:
+    """
+    Caps the CPU time and address space the next job may use on top of what its process already
+    uses, and returns the previous limits for `_restore_limits`. Exceeding the CPU limit kills
+    the job's process with SIGXCPU; exceeding the memory limit raises MemoryError inside the script.
+    """
+    import resource
+
+    previous = []
+    if cpu_seconds:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        limit = int(usage.ru_utime + usage.ru_stime) + 1 + cpu_seconds
+        if hard == resource.RLIM_INFINITY or limit <= hard:
+            previous.append((resource.RLIMIT_CPU, (soft, hard)))
+            resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+    if memory_mb and os.path.exists("/proc/self/statm"):
+        with open("/proc/self/statm") as statm:
+            mapped = int(statm.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+        soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = mapped + memory_mb * 1024 * 1024
+        if hard == resource.RLIM_INFINITY or limit <= hard:
+            previous.append((resource.RLIMIT_AS, (soft, hard)))
+            resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    return previous
+
+
+def _restore_limits(previous: List[tuple]) -> None:
+    import resource
+
+    for kind, limits in previous:
+        resource.setrlimit(kind, limits)
+
+
+def _run_job(cwd: str, filename: str, code: str, head_bytes: int, tail_bytes: int, cpu_seconds: Optional[int] = None, memory_mb: Optional[int] = None):
+    """
+    Runs one script in a job child and returns (exit_code, output preview, changed files).
+    The full output is streamed to the spool file in `cwd`; only its head and tail come back.
+    File descriptors 1 and 2 point at the spool file too, so output of subprocesses, `os.system`
+    and C extensions is captured along with the script's own prints.
+    """
+    os.makedirs(cwd, exist_ok=True)
+    before = snapshot(Path(cwd))
+    home = os.getcwd()
+    os.chdir(cwd)
+    Path(filename).write_text(code)
+    exit_code = 0
+    sys.argv = [filename]
+    sys.path.insert(0, cwd)
+    try:
+        with open(OUTPUT_FILENAME, "w", buffering=1, errors="replace") as output:  # Line-buffered, so prints keep their order with fd writes
+            os.dup2(output.fileno(), 1)
+            os.dup2(output.fileno(), 2)
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                limits = _apply_limits(cpu_seconds, memory_mb)
+                try:
+                    exec(compile(code, filename, "exec"), {"__name__": "__main__", "__file__": filename})
+                except SystemExit as e:
+                    exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+                except BaseException:
+                    traceback.print_exc()
+                    exit_code = 1
+                finally:
+                    _restore_limits(limits)
+        preview = capture_file(Path(OUTPUT_FILENAME), head_bytes, tail_bytes).preview()
+        files = changed_files(before, snapshot(Path(".")))
+    finally:
+        if "matplotlib.pyplot" in sys.modules:
+            sys.modules["matplotlib.pyplot"].close("all")
+        sys.path.remove(cwd)
+        os.chdir(home)
+    return exit_code, preview, files
+
+
+def _run_forked(job) -> object:
+    """
+    Runs `job` in a child forked from this worker, so it starts from the clean post-import state
+    and leaves nothing behind: environment, imported modules, library options and monkeypatches
+    all die with the child. Returns the job's reply, or the child's exit code if it crashed.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        status = 1
+        try:
+            with os.fdopen(write_fd, "wb") as reply:
+                pickle.dump(_run_job(*job), reply)
+            status = 0
+        finally:
+            os._exit(status)  # Skip the worker's atexit handlers and buffered stdio
+    os.close(write_fd)
+    with os.fdopen(read_fd, "rb") as reply:
+        data = reply.read()
+    _, status = os.waitpid(pid, 0)
+    return pickle.loads(data) if data else os.waitstatus_to_exitcode(status)
+
+
+def _worker_main(conn, preload: Sequence[str]) -> None:
+    os.setpgid(0, 0)  # Job children join this group, so killing the group also stops a running job
+    _import_modules(preload)
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        conn.send(_run_forked(job))
+
+
+class _Worker:
+    def __init__(self, ctx, preload: Sequence[str]):
+        self._conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child, tuple(preload)), daemon=True)
+        self.process.start()
+        child.close()
+        self.jobs = 0
+
+    def run(self, job, timeout: float, is_cancelled: Callable[[], bool]):
+        """
+        Sends `job` and waits for the reply: the job's result tuple, the exit code of a crashed job,
+        or None on timeout, cancellation or a crashed worker.
+        """
+        self.jobs += 1
+        try:
+            self._conn.send(job)
+            waited = 0.0
+            while not self._conn.poll(0.1):
+                waited += 0.1
+                if waited >= timeout or is_cancelled() or not self.process.is_alive():
+                    return None
+            return self._conn.recv()
+        except (EOFError, OSError):
+            return None
+
+    def stop(self) -> None:
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self.kill()
+
+    def kill(self) -> None:
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass  # The worker has not created its group yet, or it is gone
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=1)
+        self._conn.close()
+
+
+def _crash_reason(exitcode: int) -> str:
+    if exitcode == -signal.SIGXCPU:
+        return "CPU time limit exceeded"
+    if exitcode < 0:
+        return f"Process killed by signal {signal.Signals(-exitcode).name}"
+    return f"Process exited with code {exitcode}"
+
+
+def _job_crash(cwd: Path, exitcode: int, head_bytes: int, tail_bytes: int) -> CodeResult:
+    """
+    Result of a job whose child exited before replying, e.g. through `os._exit` or a segfault,
+    with the shell's exit code convention (128 + signal number) and the output it spooled.
+    """
+    reason = f"Script ended abnormally: {_crash_reason(exitcode)}"
+    output_path = cwd / OUTPUT_FILENAME
+    try:
+        with open(output_path, "a") as output:
+            output.write(f"\n{reason}\n")
+        preview = capture_file(output_path, head_bytes, tail_bytes).preview()
+    except OSError:
+        preview = f"\n{reason}\n"
+    return CodeResult(exit_code=exitcode if exitcode >= 0 else 128 - exitcode, output=preview)
+
+
+class WarmWorkerPool:
+    """
+    Pool of long-lived Python worker processes with the heavy data libraries already imported.
+
+    Workers are started from a fork server that has `preload` imported, so both the initial
+    workers and their replacements skip the pandas/matplotlib import cost. A worker never runs
+    a job itself: it forks a fresh child per job, so jobs of different requests and sessions
+    share no interpreter state. Each job runs in its own working directory and streams its
+    output to a spool file there, so only a bounded head and tail of the output are held in
+    memory. A worker is recycled after `max_jobs_per_worker` jobs or when a job times out; jobs'
+    memory is returned when their child exits. Each job is also limited to `cpu_seconds` of CPU
+    time and `memory_mb` of extra address space.
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        *,
+        preload: Sequence[str] = PRELOAD_MODULES,
+        max_jobs_per_worker: int = 50,
+        timeout: float = 60,
+        cpu_seconds: Optional[int] = 60,
+        memory_mb: Optional[int] = 2048,
+        output_head_bytes: int = DEFAULT_HEAD_BYTES,
+        output_tail_bytes: int = DEFAULT_TAIL_BYTES,
+    ):
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            self._ctx = multiprocessing.get_context("forkserver")
+            self._ctx.set_forkserver_preload(list(preload))
+        else:
+            self._ctx = multiprocessing.get_context("spawn")
+        self._preload = preload
+        self._max_jobs_per_worker = max_jobs_per_worker
+        self.timeout = timeout
+        self._output_limits = (output_head_bytes, output_tail_bytes)
+        self._resource_limits = (cpu_seconds, memory_mb)
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        for _ in range(size):
+            self._idle.put(_Worker(self._ctx, preload))
+
+    def run(
+        self,
+        cwd: Path,
+        filename: str,
+        code: str,
+        is_cancelled: Callable[[], bool] = lambda: False,
+    ) -> CodeResult:
+        """
+        Runs `code` saved as `filename` in `cwd` on an idle worker; blocks until a worker is free.
+        """
+        worker = self._idle.get()
+        try:
+            if is_cancelled():
+                return CodeResult(exit_code=124, output="\nCancelled")
+            reply = worker.run((str(cwd.resolve()), filename, code, *self._output_limits, *self._resource_limits), self.timeout, is_cancelled)
+            if isinstance(reply, int):
+                return _job_crash(cwd, reply, *self._output_limits)  # Only the job's child died; the worker is fine
+            if reply is None:
+                worker.kill()
+                exitcode = worker.process.exitcode
+                if is_cancelled():
+                    reason = "Cancelled"
+                elif exitcode is not None and exitcode != -signal.SIGKILL:
+                    reason = f"Worker died: {_crash_reason(exitcode)}"
+                else:
+                    reason = "Timeout"
+                worker = _Worker(self._ctx, self._preload)
+                return CodeResult(exit_code=124, output=f"\n{reason}")
+            exit_code, output, files = reply
+            if worker.jobs >= self._max_jobs_per_worker:
+                worker.stop()
+                worker = _Worker(self._ctx, self._preload)
+            return ManifestCodeResult(exit_code=exit_code, output=output, files=files)
+        finally:
+            self._idle.put(worker)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+
+_worker_pool: Optional[WarmWorkerPool] = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> WarmWorkerPool:
+    """
+    Returns the process-wide worker pool, starting it on first use.
+    """
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = WarmWorkerPool(size=DEFAULT_WORKERS)
+        return _worker_pool
+
+
+class WarmPoolCodeExecutor(CodeExecutor):
+    """
+    Code executor that runs Python blocks on a `WarmWorkerPool` inside `work_dir`.
+
+    Like `LocalCommandLineCodeExecutor`, each block is saved as `tmp_code_<sha256>.py` in the
+    working directory. Blocks in other languages are delegated to `LocalCommandLineCodeExecutor`.
+    The result lists the files the blocks created or modified, so callers need not rescan the directory.
+    """
+
+    def __init__(self, work_dir: Path, pool: Optional[WarmWorkerPool] = None):
+        self.work_dir = work_dir
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self._pool = pool if pool is not None else get_worker_pool()
+
+    async def execute_code_blocks(
+        self, code_blocks: List[CodeBlock], cancellation_token: CancellationToken
+    ) -> ManifestCodeResult:
+        outputs = []
+        files = set()
+        exit_code = 0
+        for block in code_blocks:
+            if block.language.lower() in PYTHON_LANGUAGES:
+                filename = f"tmp_code_{hashlib.sha256(block.code.encode()).hexdigest()}.py"
+                result = await asyncio.to_thread(
+                    self._pool.run, self.work_dir, filename, block.code, cancellation_token.is_cancelled
+                )
+            else:
+                from autogen_ext.code_executors.local import LocalCommandLineCodeExecutor  # Rarely needed, slow to import
+
+                before = await asyncio.to_thread(snapshot, self.work_dir)
+                result = await LocalCommandLineCodeExecutor(work_dir=self.work_dir).execute_code_blocks(
+                    [block], cancellation_token
+                )
+                after = await asyncio.to_thread(snapshot, self.work_dir)
+                result = ManifestCodeResult(result.exit_code, result.output, changed_files(before, after))
+            outputs.append(result.output)
+            files.update(getattr(result, "files", []))
+            exit_code = result.exit_code
+            if exit_code != 0:
+                break
+        return ManifestCodeResult(exit_code=exit_code, output="".join(outputs), files=sorted(files))
+
+    async def restart(self) -> None:
+        pass
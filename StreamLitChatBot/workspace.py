@@ -0,0 +1,182 @@
+import shutil
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+@dataclass
+class WorkspaceUsage:
+    bytes: int
+    inodes: int
+    requests: int
+
+
+def _measure(path: Path) -> Tuple[int, int]:
+    size, inodes = 0, 1
+    for child in path.rglob("*"):
+        inodes += 1
+        if child.is_file() and not child.is_symlink():
+            size += child.stat().st_size
+    return size, inodes
+
+
+class WorkspaceManager:
+    """
+    Owns the `root/<session>/<request>` working directories of CloudServeAgent.
+
+    Request directories are leased while a request runs. A daemon thread periodically removes
+    unleased request directories older than `max_age` seconds and, if the tree still exceeds
+    `quota_bytes`, the oldest ones until it fits. No cleanup happens on the request path.
+    Collectors added with `add_collector` run on the same thread with the same `max_age`, so
+    data kept elsewhere about the requests, such as chat histories, expires along with them.
+
+    Removal does not check whether a chat history still refers to a request: results older
+    than `max_age`, or the oldest ones under quota pressure, render without their files.
+    """
+
+    def __init__(
+        self,
+        root: Path = Path("cloudserve"),
+        *,
+        max_age: float = 24 * 3600,
+        quota_bytes: int = 2 * 1024 * 1024 * 1024,
+        gc_interval: float = 300,
+    ):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._max_age = max_age
+        self._quota_bytes = quota_bytes
+        self._gc_interval = gc_interval
+        self._leases: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._gc_thread: Optional[threading.Thread] = None
+        self._collectors: List[Callable[[float], object]] = []
+
+    def session_dir(self, session_id: str) -> Path:
+        path = self.root / session_id
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def acquire(self, session_id: str, request_id: Optional[str] = None) -> Path:
+        """
+        Creates (or reuses) a request directory and leases it so garbage collection leaves it alone.
+        """
+        path = self.session_dir(session_id) / (request_id or str(uuid.uuid4()))
+        with self._lock:
+            self._leases[path] += 1
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def release(self, path: Path) -> None:
+        with self._lock:
+            self._leases[path] -= 1
+            if self._leases[path] <= 0:
+                del self._leases[path]
+        path.touch(exist_ok=True)  # Age counts from the end of the request
+
+    @contextmanager
+    def request_dir(self, session_id: str, request_id: Optional[str] = None) -> Iterator[Path]:
+        path = self.acquire(session_id, request_id)
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+    def _request_dirs(self) -> List[Path]:
+        return [request for session in self.root.iterdir() if session.is_dir() for request in session.iterdir() if request.is_dir()]
+
+    def usage(self) -> WorkspaceUsage:
+        total_bytes, total_inodes, requests = 0, 0, 0
+        for request in self._request_dirs():
+            size, inodes = _measure(request)
+            total_bytes += size
+            total_inodes += inodes
+            requests += 1
+        return WorkspaceUsage(total_bytes, total_inodes, requests)
+
+    def collect(self) -> int:
+        """
+        Removes expired request directories, then the oldest ones while over quota. Returns how many were removed.
+        """
+        now = time.time()
+        candidates: List[Tuple[float, int, Path]] = []
+        total = 0
+        for request in self._request_dirs():
+            size, _ = _measure(request)
+            total += size
+            candidates.append((request.stat().st_mtime, size, request))
+
+        removed = 0
+        for mtime, size, request in sorted(candidates, key=lambda item: item[0]):
+            if now - mtime <= self._max_age and total <= self._quota_bytes:
+                break
+            with self._lock:
+                if request in self._leases:
+                    continue
+            shutil.rmtree(request, ignore_errors=True)
+            total -= size
+            removed += 1
+
+        for session in self.root.iterdir():
+            if session.is_dir() and not any(session.iterdir()):
+                try:
+                    session.rmdir()
+                except OSError:
+                    pass  # A request started in this session meanwhile
+        return removed
+
+    def add_collector(self, collector: Callable[[float], object]) -> None:
+        """
+        Registers `collector(max_age)` to run after each background collection.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def start_gc(self) -> None:
+        """
+        Starts the background collection thread once.
+        """
+        with self._lock:
+            if self._gc_thread is not None:
+                return
+            self._gc_thread = threading.Thread(target=self._gc_loop, name="workspace-gc", daemon=True)
+            self._gc_thread.start()
+
+    def stop_gc(self) -> None:
+        self._stop.set()
+
+    def _gc_loop(self) -> None:
+        while not self._stop.wait(self._gc_interval):
+            try:
+                self.collect()
+            except OSError:
+                pass  # A directory vanished mid-scan; the next pass catches up
+            with self._lock:
+                collectors = list(self._collectors)
+            for collector in collectors:
+                try:
+                    collector(self._max_age)
+                except OSError:
+                    pass
+
+
+_managers: Dict[Path, WorkspaceManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_workspace_manager(root: Path = Path("cloudserve")) -> WorkspaceManager:
+    """
+    Returns the process-wide manager for `root`, with its garbage collector running.
+    """
+    key = root.resolve()
+    with _managers_lock:
+        if key not in _managers:
+            _managers[key] = WorkspaceManager(root)
+            _managers[key].start_gc()
+        return _managers[key]